@@ -0,0 +1,160 @@
+import asyncio
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+
+# Методы, которые адресованы чату и считаются ответом бота пользователю
+REPLY_METHODS = ("sendMessage", "sendPhoto", "sendDocument", "editMessageText")
+
+
+class FakeTelegram:
+    """
+    Локальная замена Bot API для нагрузочного тестирования.
+
+    Реализует методы, которые использует бот, и раздачу файлов. Обновления
+    для бота кладутся в очередь через push_* и отдаются long polling'ом
+    getUpdates. Ответы бота можно ожидать через expect(): фьючерс
+    завершается при первом подходящем вызове, адресованном чату.
+    """
+
+    def __init__(self, token: str, file_size: int = 256 * 1024):
+        self.token = token
+        self.bot_user = {"id": int(token.split(":")[0]), "is_bot": True, "first_name": "Bench",
+                         "username": "bench_bot"}
+        self.file_payload = b"%PDF-1.4\n" + b"x" * max(file_size - 9, 0)
+        self.calls: Counter = Counter()
+        self._updates: List[dict] = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_update = asyncio.Event()
+        self._waiters: Dict[int, List[Tuple[Optional[str], asyncio.Future]]] = defaultdict(list)
+        self._runner: Optional[web.AppRunner] = None
+
+    # --- HTTP-сервер ---
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._api)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._file)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        # Отпускаем висящий long polling, чтобы сервер остановился сразу
+        self._new_update.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # --- Обновления от "пользователей" ---
+    def _push(self, kind: str, obj: dict) -> None:
+        self._update_id += 1
+        self._updates.append({"update_id": self._update_id, kind: obj})
+        self._new_update.set()
+
+    def push_message(self, user: dict, text: Optional[str] = None, **fields) -> None:
+        self._message_id += 1
+        message = {"message_id": self._message_id, "date": int(time.time()),
+                   "chat": {"id": user["id"], "type": "private"}, "from": user, **fields}
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self._push("message", message)
+
+    def push_callback(self, user: dict, message: dict, data: str) -> None:
+        self._push("callback_query", {"id": str(self._update_id + 1), "from": user, "message": message,
+                                      "chat_instance": str(user["id"]), "data": data})
+
+    def expect(self, chat_id: int, text_prefix: Optional[str] = None) -> asyncio.Future:
+        # Фьючерс с сообщением бота, которое первым придет в чат (и начнется с text_prefix)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append((text_prefix, future))
+        return future
+
+    def _notify(self, chat_id: int, message: dict) -> None:
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        text = message.get("text") or message.get("caption") or ""
+        for item in list(waiters):
+            prefix, future = item
+            if prefix is None or text.startswith(prefix):
+                waiters.remove(item)
+                if not future.done():
+                    future.set_result(message)
+                return
+
+    # --- Bot API ---
+    def _message(self, chat_id: int, **fields) -> dict:
+        self._message_id += 1
+        return {"message_id": self._message_id, "date": int(time.time()), "from": self.bot_user,
+                "chat": {"id": chat_id, "type": "private"}, **fields}
+
+    async def _api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        self.calls[method] += 1
+        handler = getattr(self, f"_method_{method}", None)
+        if handler is None:
+            result = True
+        else:
+            result = await handler(params)
+        if method in REPLY_METHODS and isinstance(result, dict):
+            self._notify(result["chat"]["id"], result)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _file(self, request: web.Request) -> web.StreamResponse:
+        self.calls["file"] += 1
+        return web.Response(body=self.file_payload, content_type="application/octet-stream")
+
+    async def _method_getMe(self, params: dict) -> dict:
+        return self.bot_user
+
+    async def _method_getUpdates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        # Подтвержденные обновления удаляются, как в настоящем Bot API
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit") or 100)]
+
+    async def _method_sendMessage(self, params: dict) -> dict:
+        return self._message(int(params["chat_id"]), text=params.get("text", ""))
+
+    async def _method_editMessageText(self, params: dict) -> dict:
+        # Отредактированное сообщение сохраняет свой message_id
+        return {**self._message(int(params["chat_id"]), text=params.get("text", "")),
+                "message_id": int(params["message_id"])}
+
+    async def _method_sendPhoto(self, params: dict) -> dict:
+        file_id = params["photo"] if isinstance(params["photo"], str) else f"photo-{self._message_id + 1}"
+        return self._message(int(params["chat_id"]), caption=params.get("caption", ""), photo=[
+            {"file_id": file_id, "file_unique_id": file_id, "width": 512, "height": 512}
+        ])
+
+    async def _method_sendDocument(self, params: dict) -> dict:
+        file_id = params["document"] if isinstance(params["document"], str) else f"doc-{self._message_id + 1}"
+        return self._message(int(params["chat_id"]), caption=params.get("caption", ""), document={
+            "file_id": file_id, "file_unique_id": file_id, "file_name": "file.pdf"
+        })
+
+    async def _method_getFile(self, params: dict) -> dict:
+        file_id = params["file_id"]
+        return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.file_payload),
+                "file_path": f"documents/{file_id}.pdf"}
+
+    async def _method_getWebhookInfo(self, params: dict) -> dict:
+        return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
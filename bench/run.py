@@ -0,0 +1,216 @@
+"""
+Нагрузочный тест бота на локальных заменах Telegram и SMTP.
+
+Бот запускается в этом же процессе в режиме long polling против FakeTelegram,
+письма уходят в SmtpSink. N пользователей параллельно проходят весь диалог
+заявки (согласие -> имя -> email -> сообщение -> файл), администраторы
+параллельно оформляют заявки из пересланных сообщений. В конце выводятся
+заявки в секунду, p50/p95/p99 по шагам и пиковый RSS процесса.
+
+Нужен PostgreSQL из настроек POSTGRES_* (.env или окружение). Используйте
+отдельную базу: бенчмарк создает в ней заявки.
+
+    python -m bench.run --users 200 --concurrency 50 --forwards 40
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from bench.fake_telegram import FakeTelegram
+from bench.smtp_sink import SmtpSink
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_TOKEN = "123456789:BENCH-local-token"
+FIRST_ADMIN_ID = 900_000_001
+FIRST_USER_ID = 1_000_000_000
+
+SUCCESS_TEXT = "Ваша заявка отправлена"
+
+
+class Recorder:
+    def __init__(self):
+        self.steps: Dict[str, List[float]] = defaultdict(list)
+        self.tickets = 0
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, step: str, seconds: float) -> None:
+        self.steps[step].append(seconds)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+async def _step(tg: FakeTelegram, rec: Recorder, chat_id: int, name: str, push, timeout: float,
+                prefix: str = None) -> dict:
+    # Отправляет обновление и ждет ответа бота в чат, время ответа записывается под именем шага
+    future = tg.expect(chat_id, prefix)
+    started = time.perf_counter()
+    push()
+    message = await asyncio.wait_for(future, timeout)
+    rec.record(name, time.perf_counter() - started)
+    return message
+
+
+async def run_user(tg: FakeTelegram, rec: Recorder, index: int, timeout: float) -> None:
+    user = {"id": FIRST_USER_ID + index, "is_bot": False, "first_name": f"User{index}",
+            "username": f"bench_user{index}"}
+    uid = user["id"]
+    started = time.perf_counter()
+    menu = await _step(tg, rec, uid, "start", lambda: tg.push_message(user, "/start"), timeout)
+    consent = await _step(tg, rec, uid, "start_support", lambda: tg.push_callback(user, menu, "start_support"),
+                          timeout)
+    await _step(tg, rec, uid, "consent", lambda: tg.push_callback(user, consent, "consent_yes"), timeout)
+    await _step(tg, rec, uid, "name", lambda: tg.push_message(user, f"Пользователь {index}"), timeout)
+    await _step(tg, rec, uid, "email", lambda: tg.push_message(user, f"user{index}@example.com"), timeout)
+    ask_file = await _step(tg, rec, uid, "message",
+                           lambda: tg.push_message(user, f"Не открывается документ, обращение №{index}"), timeout)
+    await _step(tg, rec, uid, "file_choice", lambda: tg.push_callback(user, ask_file, "yes_support"), timeout)
+    document = {"file_id": f"bench-doc-{index}", "file_unique_id": f"bench-doc-{index}",
+                "file_name": f"report_{index}.pdf", "mime_type": "application/pdf",
+                "file_size": len(tg.file_payload)}
+    result = await _step(tg, rec, uid, "file_upload", lambda: tg.push_message(user, document=document), timeout)
+    if not result.get("text", "").startswith(SUCCESS_TEXT):
+        raise RuntimeError(result.get("text"))
+    rec.record("ticket_total", time.perf_counter() - started)
+    rec.tickets += 1
+
+
+async def run_admin(tg: FakeTelegram, rec: Recorder, admin_index: int, forwards: int, timeout: float) -> None:
+    # Один администратор оформляет заявки последовательно: его FSM общий для всех пересылок
+    from aiogram.dispatcher import DEFAULT_RATE_LIMIT
+    admin = {"id": FIRST_ADMIN_ID + admin_index, "is_bot": False, "first_name": f"Admin{admin_index}",
+             "username": f"bench_admin{admin_index}"}
+    for index in range(forwards):
+        sender = {"id": FIRST_USER_ID - 1 - index, "is_bot": False, "first_name": f"Client{index}",
+                  "username": f"bench_client{index}"}
+        started = time.perf_counter()
+        try:
+            await _step(tg, rec, admin["id"], "forward",
+                        lambda: tg.push_message(admin, f"Переслано: ошибка подписи, клиент {index}",
+                                                forward_from=sender, forward_date=int(time.time())),
+                        timeout, prefix="Введите email пользователя")
+            await _step(tg, rec, admin["id"], "forward_email",
+                        lambda: tg.push_message(admin, f"client{index}@example.com"), timeout, prefix=SUCCESS_TEXT)
+            rec.record("forward_total", time.perf_counter() - started)
+            rec.tickets += 1
+        except Exception as e:
+            rec.errors[f"forward: {type(e).__name__}"] += 1
+        # Не попадаем под антифлуд: обработчики пересылки вызываются одним пользователем подряд
+        await asyncio.sleep(max(DEFAULT_RATE_LIMIT * 1.5 - (time.perf_counter() - started), 0))
+
+
+def report(rec: Recorder, elapsed: float, sink: SmtpSink, tg: FakeTelegram, emails_drained: float) -> None:
+    print()
+    print(f"Заявок оформлено: {rec.tickets} за {elapsed:.2f} с -> {rec.tickets / elapsed:.1f} заявок/с")
+    print()
+    print(f"{'Шаг':<16}{'n':>7}{'p50, мс':>11}{'p95, мс':>11}{'p99, мс':>11}{'max, мс':>11}")
+    for step, values in rec.steps.items():
+        print(f"{step:<16}{len(values):>7}"
+              + "".join(f"{percentile(values, q) * 1000:>11.1f}" for q in (0.5, 0.95, 0.99, 1.0)))
+    print()
+    print(f"Писем принято SMTP: {sink.messages} ({sink.bytes / 1024 / 1024:.1f} МБ), "
+          f"доставка очереди завершена через {emails_drained:.2f} с после последней заявки")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+    print(f"Пиковый RSS процесса (бот + заглушки): {rss_mb:.1f} МБ")
+    print("Вызовы Bot API: " + ", ".join(f"{method}={count}" for method, count in tg.calls.most_common()))
+    if rec.errors:
+        print("Ошибки: " + ", ".join(f"{kind}={count}" for kind, count in rec.errors.items()))
+
+
+async def bench(args: argparse.Namespace) -> int:
+    os.chdir(ROOT)
+    sink = SmtpSink(tls=not args.no_tls)
+    smtp_port = await sink.start()
+    tg = FakeTelegram(BENCH_TOKEN, file_size=args.file_size)
+    api_url = await tg.start()
+    temp_dir = tempfile.mkdtemp(prefix="bench-files-")
+    admin_ids = [FIRST_ADMIN_ID + index for index in range(args.admins)]
+
+    # Настройки должны быть заданы до импорта main: date/config.py читает окружение при импорте
+    os.environ.update({
+        "TELEGRAM_TOKEN": BENCH_TOKEN,
+        "ADMIN_IDS": ",".join(map(str, admin_ids)),
+        "MEDIA_CACHE_CHAT_ID": str(admin_ids[0]),
+        "EMAIL_RECEIVER": "support@example.com",
+        "EMAIL_HOST": "127.0.0.1",
+        "EMAIL_PORT": str(smtp_port),
+        "EMAIL_USER": "bot@example.com",
+        "EMAIL_PASSWORD": "bench",
+        "TEMP_DIR": temp_dir,
+        "RUN_MODE": "polling",
+        "WORKER_PROCESSES": "1",
+        "METRICS_PORT": "0",
+    })
+    import main as bot_main
+    from aiogram.bot.api import TelegramAPIServer
+
+    logging.getLogger().setLevel(args.log_level)
+    bot_main.bot.server = TelegramAPIServer.from_base(api_url)
+    dp = bot_main.dp
+    await bot_main.on_startup(dp)
+    polling = asyncio.create_task(dp.start_polling(timeout=1, relax=0))
+
+    rec = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user_task(index: int) -> None:
+        async with semaphore:
+            try:
+                await run_user(tg, rec, index, args.timeout)
+            except Exception as e:
+                rec.errors[f"user: {type(e).__name__}"] += 1
+
+    per_admin = [args.forwards // args.admins + (1 if i < args.forwards % args.admins else 0)
+                 for i in range(args.admins)]
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(user_task(index) for index in range(args.users)),
+        *(run_admin(tg, rec, index, count, args.timeout) for index, count in enumerate(per_admin)),
+    )
+    elapsed = time.perf_counter() - started
+
+    # Письма по заявкам пользователей отправляет outbox в фоне - дожидаемся доставки
+    expected_emails = rec.tickets
+    await sink.wait_for(expected_emails, args.drain_timeout)
+    emails_drained = time.perf_counter() - started - elapsed
+
+    dp.stop_polling()
+    await dp.wait_closed()
+    await asyncio.gather(polling, return_exceptions=True)
+    await bot_main.on_shutdown(dp)
+    session = await dp.bot.get_session()
+    await session.close()
+    await tg.stop()
+    await sink.stop()
+
+    report(rec, elapsed, sink, tg, emails_drained)
+    return 1 if rec.errors else 0
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота технической поддержки")
+    parser.add_argument("--users", type=int, default=100, help="пользователей, проходящих диалог заявки")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременно активных пользователей")
+    parser.add_argument("--forwards", type=int, default=20, help="заявок из пересланных сообщений")
+    parser.add_argument("--admins", type=int, default=2, help="администраторов (получают уведомления)")
+    parser.add_argument("--file-size", type=int, default=256 * 1024, help="размер вложения в байтах")
+    parser.add_argument("--timeout", type=float, default=30, help="таймаут ответа бота на шаг, с")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="ожидание доставки писем, с")
+    parser.add_argument("--no-tls", action="store_true", help="SMTP без STARTTLS (если нет openssl)")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(bench(parse_args())))
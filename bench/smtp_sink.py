@@ -0,0 +1,139 @@
+import asyncio
+import os
+import ssl
+import subprocess
+import tempfile
+from typing import Optional
+
+
+def self_signed_context(directory: str) -> ssl.SSLContext:
+    # Самоподписанный сертификат для STARTTLS (smtplib.starttls() по умолчанию его не проверяет)
+    cert, key = os.path.join(directory, "sink.crt"), os.path.join(directory, "sink.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+         "-days", "1", "-subj", "/CN=localhost"],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class _SmtpProtocol(asyncio.Protocol):
+    # Минимальный SMTP-сервер: принимает любые письма и только считает их
+    def __init__(self, sink: "SmtpSink"):
+        self.sink = sink
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = b""
+        self.in_data = False
+        self.message_size = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sink.connections += 1
+        self._reply("220 localhost bench SMTP sink")
+
+    def _reply(self, line: str) -> None:
+        self.transport.write(line.encode() + b"\r\n")
+
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        while b"\r\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\r\n", 1)
+            if self.in_data:
+                self._data_line(line)
+            elif self._command(line.decode("utf-8", "replace")):
+                # После STARTTLS чтение продолжится уже в зашифрованном канале
+                return
+
+    def _data_line(self, line: bytes) -> None:
+        if line == b".":
+            self.in_data = False
+            self.sink.messages += 1
+            self.sink.bytes += self.message_size
+            self.message_size = 0
+            self._reply("250 OK: queued")
+        else:
+            self.message_size += len(line) + 2
+
+    def _command(self, line: str) -> bool:
+        verb = line.split(" ", 1)[0].upper()
+        if verb == "EHLO":
+            self._reply("250-localhost")
+            if self.sink.tls_context is not None:
+                self._reply("250-STARTTLS")
+            self._reply("250-AUTH PLAIN")
+            self._reply("250 SIZE 104857600")
+        elif verb == "HELO":
+            self._reply("250 localhost")
+        elif verb == "STARTTLS" and self.sink.tls_context is not None:
+            self._reply("220 Ready to start TLS")
+            self.transport.pause_reading()
+            asyncio.get_running_loop().create_task(self._start_tls())
+            return True
+        elif verb == "AUTH":
+            self._reply("235 Authentication successful")
+        elif verb == "DATA":
+            self.in_data = True
+            self._reply("354 End data with <CR><LF>.<CR><LF>")
+        elif verb == "QUIT":
+            self._reply("221 Bye")
+            self.transport.close()
+        elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+            self._reply("250 OK")
+        else:
+            self._reply("502 Command not implemented")
+        return False
+
+    async def _start_tls(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            self.transport = await loop.start_tls(self.transport, self, self.sink.tls_context, server_side=True)
+        except (ConnectionError, ssl.SSLError):
+            self.transport.close()
+            return
+        self.buffer = b""
+
+    def connection_lost(self, exc):
+        self.sink.connections -= 1
+
+
+class SmtpSink:
+    """SMTP-сервер для бенчмарка: поддерживает STARTTLS и AUTH, письма не сохраняет."""
+
+    def __init__(self, tls: bool = True):
+        self.tls = tls
+        self.tls_context: Optional[ssl.SSLContext] = None
+        self.messages = 0
+        self.bytes = 0
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tmp: Optional[tempfile.TemporaryDirectory] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        if self.tls:
+            self._tmp = tempfile.TemporaryDirectory(prefix="bench-smtp-")
+            self.tls_context = self_signed_context(self._tmp.name)
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: _SmtpProtocol(self), host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def wait_for(self, messages: int, timeout: float) -> bool:
+        # Ждет, пока сервер примет не меньше messages писем
+        deadline = loop_time() + timeout
+        while self.messages < messages:
+            if loop_time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+
+def loop_time() -> float:
+    return asyncio.get_running_loop().time()
@@ -8,6 +8,65 @@ load_dotenv()
 # Токен бота
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 
+# Режим работы: polling (long polling) или webhook (встроенный aiohttp-сервер)
+RUN_MODE = os.getenv("RUN_MODE", "polling").lower()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")
+# Сколько секунд при остановке ждать завершения обрабатываемых обновлений
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+# Метрики Prometheus: в режиме webhook отдаются сервером webhook, иначе - отдельным сервером
+# на METRICS_PORT (процессы-обработчики используют METRICS_PORT + номер процесса + 1); 0 - отключить
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Логи пишутся в stderr фоновым потоком: LOG_FORMAT json (одна строка JSON на запись) или text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Доля сохраняемых частых записей (1 - все, 0.01 - каждая сотая): уровень DEBUG
+# и записи ниже WARNING от логгеров из LOG_SAMPLED_LOGGERS (через запятую)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_SAMPLED_LOGGERS = [name for name in os.getenv("LOG_SAMPLED_LOGGERS", "aiogram.contrib.middlewares.logging").split(",") if name]
+
+# Число процессов-обработчиков; при значении больше 1 main.py запускает супервизор,
+# который принимает обновления и распределяет их по процессам по chat_id
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "100"))  # одновременно обрабатываемых обновлений в процессе
+
+# Ограничения Telegram Bot API для рассылок администраторам
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # сообщений в секунду на бота
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # сообщений в секунду в один чат
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "10"))
+FANOUT_MAX_RETRIES = int(os.getenv("FANOUT_MAX_RETRIES", "5"))
+
+# Скачивание вложений из Telegram
+TEMP_DIR = os.getenv("TEMP_DIR", "temp_files")
+MAX_DOWNLOAD_SIZE = int(os.getenv("MAX_DOWNLOAD_SIZE", str(20 * 1024 * 1024)))  # лимит Bot API - 20 МБ
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "120"))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))  # одновременных загрузок на процесс
+# Альбом (media group) приходит отдельными сообщениями: части собираются, пока между ними
+# проходит меньше MEDIA_GROUP_WINDOW секунд (но не дольше MEDIA_GROUP_MAX_WAIT), и дают одну заявку
+MEDIA_GROUP_WINDOW = float(os.getenv("MEDIA_GROUP_WINDOW", "1"))
+MEDIA_GROUP_MAX_WAIT = float(os.getenv("MEDIA_GROUP_MAX_WAIT", "5"))
+
+# Хранилище вложений заявок (файлы адресуются по SHA-256, одинаковые файлы хранятся один раз).
+# Фоновая очистка раз в ATTACHMENT_JANITOR_INTERVAL секунд удаляет файлы, не использованные
+# ATTACHMENT_RETENTION секунд, файлы без заявок - через ATTACHMENT_ORPHAN_TTL секунд, и при превышении
+# ATTACHMENTS_MAX_BYTES - самые давно использованные файлы (0 - без квоты)
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "attachments")
+ATTACHMENT_RETENTION = float(os.getenv("ATTACHMENT_RETENTION", str(90 * 24 * 3600)))
+ATTACHMENT_ORPHAN_TTL = float(os.getenv("ATTACHMENT_ORPHAN_TTL", str(24 * 3600)))
+ATTACHMENTS_MAX_BYTES = int(os.getenv("ATTACHMENTS_MAX_BYTES", str(10 * 1024 ** 3)))
+ATTACHMENT_JANITOR_INTERVAL = float(os.getenv("ATTACHMENT_JANITOR_INTERVAL", "3600"))
+
 # Данные для отправки email
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = os.getenv("EMAIL_PORT")
@@ -15,6 +74,23 @@ EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 # EMAIL_RECEIVER = os.getenv("EMAIL_RECEIVER")
 
+# Асинхронная отправка email: число воркеров, размер очереди и таймаут SMTP-сессии
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "100"))
+EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", "30"))
+# Через сколько секунд простоя соединение проверяется командой NOOP перед отправкой
+EMAIL_KEEPALIVE_CHECK = float(os.getenv("EMAIL_KEEPALIVE_CHECK", "60"))
+# Предельный размер письма; вложения, которые в него не помещаются, заменяются ссылками на файл
+# в хранилище вложений (EMAIL_ATTACHMENT_URL - публичный адрес каталога ATTACHMENTS_DIR, если он раздается)
+EMAIL_MAX_SIZE = int(os.getenv("EMAIL_MAX_SIZE", str(20 * 1024 * 1024)))
+EMAIL_ATTACHMENT_URL = os.getenv("EMAIL_ATTACHMENT_URL", "")
+# Дайджест писем о заявках: если за EMAIL_DIGEST_WINDOW секунд уже было письмо, следующие копятся
+# и уходят одним письмом по окончании окна или при EMAIL_DIGEST_MAX заявках; одиночная заявка в
+# спокойный период отправляется сразу. Окно должно быть заметно меньше OUTBOX_LEASE
+EMAIL_DIGEST = os.getenv("EMAIL_DIGEST", "false").lower() in ("1", "true", "yes")
+EMAIL_DIGEST_WINDOW = float(os.getenv("EMAIL_DIGEST_WINDOW", "30"))
+EMAIL_DIGEST_MAX = int(os.getenv("EMAIL_DIGEST_MAX", "20"))
+
 # Данные для подключения к PostgreSQL
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
@@ -22,8 +98,45 @@ POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 
+# Пул соединений с PostgreSQL
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "2"))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+POSTGRES_STATEMENT_CACHE_SIZE = int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", "100"))
+POSTGRES_POOL_ACQUIRE_TIMEOUT = float(os.getenv("POSTGRES_POOL_ACQUIRE_TIMEOUT", "10"))
+
+# Хранилище состояний FSM: postgres (постоянное) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres").lower()
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "300"))  # сколько секунд запись живет в кэше процесса
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", str(7 * 24 * 3600)))  # через сколько секунд простоя строка удаляется
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "600"))
+
+# Outbox: доставка уведомлений и писем фоновым диспетчером
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+# На сколько секунд запись "захватывается" диспетчером на время доставки
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "120"))
+
+# Пакетная запись заявок: заявки копятся до TICKET_BATCH_SIZE штук или TICKET_BATCH_DELAY секунд
+# и записываются одной транзакцией через COPY
+TICKET_BATCHING = os.getenv("TICKET_BATCHING", "false").lower() in ("1", "true", "yes")
+TICKET_BATCH_SIZE = int(os.getenv("TICKET_BATCH_SIZE", "50"))
+TICKET_BATCH_DELAY = float(os.getenv("TICKET_BATCH_DELAY", "0.01"))
+
+# Просмотр заявок администраторами: заявок на странице и время жизни кэша готовых страниц
+TICKET_PAGE_SIZE = int(os.getenv("TICKET_PAGE_SIZE", "10"))
+TICKET_PAGE_CACHE_TTL = float(os.getenv("TICKET_PAGE_CACHE_TTL", "30"))
+# Сколько последних совпадений ранжируется при полнотекстовом поиске (/search)
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "200"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+
 # Админы
 ADMIN_ID = os.getenv("ADMIN_ID")
 
 ADMIN_IDS = [int(id) for id in os.getenv("ADMIN_IDS").split(",")]
-EMAIL_RECEIVER = [str(id) for id in os.getenv("EMAIL_RECEIVER").split(",")]
\ No newline at end of file
+EMAIL_RECEIVER = [str(id) for id in os.getenv("EMAIL_RECEIVER").split(",")]
+
+# Чат, в который при прогреве кэша медиа загружаются статические файлы (по умолчанию - первый админ)
+MEDIA_CACHE_CHAT_ID = int(os.getenv("MEDIA_CACHE_CHAT_ID", ADMIN_IDS[0]))
@@ -1,59 +1,54 @@
-from aiogram import types, Dispatcher, Bot
+from aiogram import types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.email_sender import send_email
-from utils.database import create_connection
+from utils.email_digest import send_ticket_email
+from utils.database import get_connection
 from utils.valid_email import is_valid_email
-from date.config import ADMIN_IDS, TELEGRAM_TOKEN, EMAIL_RECEIVER
+from utils.fanout import fan_out, limited_call
+from utils.metrics import timed
+from utils.downloader import download_files, DownloadResult
+from utils.media_group import media_groups, message_file, send_album
+from utils.attachments import attachment_store, StoredAttachment
+from date.config import ADMIN_IDS, EMAIL_RECEIVER
+from keyboards import replies
 import logging
-import os, re
-from aiogram.utils.exceptions import TelegramAPIError
-import aiohttp
-import datetime
+import os
+from typing import Optional
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Путь для временного хранения файлов
-TEMP_DIR = "temp_files"
-os.makedirs(TEMP_DIR, exist_ok=True)
-
 # Состояния для FSM
 class SupportStates(StatesGroup):
     GET_EMAIL_FORWARDED = State()
 
-# Генерация клавиатуры
-def get_keyboard(*buttons):
-    keyboard = InlineKeyboardMarkup(row_width=len(buttons))
-    keyboard.add(*(InlineKeyboardButton(text, callback_data=data) for text, data in buttons))
-    return keyboard
-
 # Валидация email
 def validate_email(email: str) -> bool:
     return is_valid_email(email)
 
 # Сохранение заявки в базу данных
-async def save_request(data: dict):
-    conn = await create_connection()
-    try:
-        await conn.execute(
-            """INSERT INTO support_requests 
-            (user_id, user_username, name, email, message, admin_id, admin_name, document_path, photo_path) 
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)""",
-            data.get('user_id'),
-            data.get('user_username'),
-            data.get('user_name'),
-            data.get('email'),
-            data.get('forwarded_text'),
-            data.get('admin_id'),
-            data.get('admin_name'),
-            data.get('document_path'),
-            data.get('photo_path')
-        )
-    finally:
-        await conn.close()
+async def save_request(data: dict) -> int:
+    async with get_connection() as conn:
+        async with conn.transaction():
+            request_id = await conn.fetchval(
+                """INSERT INTO support_requests 
+                (user_id, user_username, name, email, message, admin_id, admin_name, document_path, photo_path,
+                 document_id, photo_id) 
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) RETURNING id""",
+                data.get('user_id'),
+                data.get('user_username'),
+                data.get('user_name'),
+                data.get('email'),
+                data.get('forwarded_text'),
+                data.get('admin_id'),
+                data.get('admin_name'),
+                data.get('document_path'),
+                data.get('photo_path'),
+                data.get('document_id'),
+                data.get('photo_id')
+            )
+            # Вложения из хранилища связываются с заявкой в той же транзакции
+            await attachment_store.link(conn, request_id, data.get('attachments', []))
+    return request_id
 
 # Отправка уведомления администратору
 async def notify_admin(message: types.Message, data: dict):
@@ -64,21 +59,29 @@ async def notify_admin(message: types.Message, data: dict):
         f"📧 Email: {data.get('email', 'не указан')}\n"
         f"📝 Сообщение:\n{data['forwarded_text']}"
     )
-    for admin in ADMIN_IDS:
-        try:
-            await message.bot.send_message(chat_id=admin, text=admin_text)
 
-            # Отправляем документ, если он есть
-            if data.get('document_path'):
-                with open(data['document_path'], 'rb') as doc:
-                    await message.bot.send_document(chat_id=admin, document=doc, caption="Прикрепленный файл")
+    async def send(admin: int) -> None:
+        await limited_call(admin, lambda: message.bot.send_message(chat_id=admin, text=admin_text))
 
-            # Отправляем фото, если оно есть
-            if data.get('photo_path'):
-                with open(data['photo_path'], 'rb') as photo:
-                    await message.bot.send_photo(chat_id=admin, photo=photo, caption="Прикрепленное фото")
-        except TelegramAPIError as e:
-            logger.error(f"Ошибка отправки уведомления админу {admin}: {e}")
+        # Альбом отправляем группами по file_id исходных сообщений
+        if len(data.get('files', [])) > 1:
+            await send_album(message.bot, admin, data['files'])
+            return
+
+        # Отправляем документ, если он есть (по file_id исходного сообщения, без повторной загрузки)
+        if data.get('document_id'):
+            await limited_call(admin, lambda: message.bot.send_document(
+                chat_id=admin, document=data['document_id'], caption="Прикрепленный файл"))
+
+        # Отправляем фото, если оно есть
+        if data.get('photo_id'):
+            await limited_call(admin, lambda: message.bot.send_photo(
+                chat_id=admin, photo=data['photo_id'], caption="Прикрепленное фото"))
+
+    results = await fan_out(ADMIN_IDS, send)
+    for admin, result in results.items():
+        if not result.ok:
+            logger.error("Ошибка отправки уведомления админу %s: %s", admin, result.error)
             await message.answer(f"Заявка создана, но не удалось уведомить администратора {admin}.")
 
 # Формирование текста письма
@@ -95,13 +98,28 @@ def format_email_text(data: dict) -> str:
         f"Имя: <b>{data['admin_name']}</b>"
     )
 
-# Обработчик пересланных сообщений
+# Перенос скачанного файла в хранилище вложений; при ошибке возвращает None
+async def store_file(downloaded: DownloadResult, name: Optional[str] = None) -> Optional[StoredAttachment]:
+    try:
+        return await attachment_store.put(downloaded, name)
+    except Exception as e:
+        logger.error("Ошибка сохранения файла в хранилище вложений: %s", e)
+        return None
+
+# Обработчик пересланных сообщений (альбом собирается в одну заявку)
 async def handle_forwarded_message(message: types.Message, state: FSMContext):
-    logger.info(f"Handling forwarded message: {message}")
+    messages = await media_groups.collect(message)
+    if messages is None:
+        # Часть альбома: заявку со всеми файлами создает обработчик первой части
+        return
+    message = messages[0]
+    # Объект сообщения целиком не логируется: update_id и chat_id добавляет контекст логов
+    logger.info("Handling forwarded message %s from %s, parts: %s", message.message_id, message.from_user.id,
+                len(messages))
 
     # Проверяем права администратора
     if message.from_user.id not in ADMIN_IDS:
-        logger.warning(f"User {message.from_user.id} is not an admin")
+        logger.warning("User %s is not an admin", message.from_user.id)
         await message.answer("Эта функция доступна только сотрудникам ТП.")
         return
 
@@ -114,63 +132,66 @@ async def handle_forwarded_message(message: types.Message, state: FSMContext):
     logger.info("Message is properly forwarded")
 
     # Извлекаем основные данные пользователя из пересланного сообщения
+    files = [(part, file) for part, file in ((part, message_file(part)) for part in messages) if file]
+    documents = [file for _, file in files if file[1] == "document"]
+    photos = [file for _, file in files if file[1] == "photo"]
     user_data = {
         "user_id": message.forward_from.id if message.forward_from else None,
         "user_username": message.forward_from.username if message.forward_from else None,
         "user_name": (
             message.forward_from.full_name if message.forward_from else message.forward_sender_name
         ),
-        "forwarded_text": message.text or message.caption,
+        # У альбома подпись обычно есть только у одной части
+        "forwarded_text": next((part.text or part.caption for part in messages if part.text or part.caption), None),
         "admin_id": message.from_user.id,
         "admin_name": message.from_user.full_name,
         "document_path": None,
-        "photo_path": None
+        "photo_path": None,
+        # SHA-256 файлов в хранилище вложений
+        "attachments": [],
+        # Файлы альбома: путь в хранилище, file_id и тип
+        "files": [],
+        # file_id вложений: администраторам файлы пересылаются по ним, без повторной загрузки
+        "document_id": documents[0][0] if documents else None,
+        "photo_id": photos[0][0] if photos else None
     }
 
-    # Проверяем, содержит ли сообщение документ (например, PDF)
-    if message.document:
-        logger.info(
-            f"Document detected: file_id={message.document.file_id}, mime_type={message.document.mime_type}, file_name={message.document.file_name}"
-        )
-        # Скачиваем документ с оригинальным именем
-        original_name = message.document.file_name or "document"
-        file_path = await download_file(
-            message.document.file_id,
-            "document",
-            original_name
-        )
-        if file_path:
-            user_data["document_path"] = file_path
-            logger.info(f"Document saved: {user_data['document_path']}")
+    for part, (file_id, file_type, file_name) in files:
+        if file_type == "document":
+            logger.info(
+                "Document detected: file_id=%s, mime_type=%s, file_name=%s",
+                file_id, part.document.mime_type, file_name
+            )
         else:
-            logger.error("Failed to download document")
-            await message.answer("Не удалось скачать прикрепленный документ.")
-
-    # Проверяем, содержит ли сообщение фото
-    elif message.photo:
-        logger.info(f"Photo detected: file_id={message.photo[-1].file_id}")
-        # Для фото генерируем имя с расширением .jpg
-        original_name = f"photo_{message.photo[-1].file_id[:8]}"  # Без .jpg здесь, добавляется в download_file
-        file_path = await download_file(
-            message.photo[-1].file_id,
-            "photo",
-            original_name
-        )
-        if file_path:
-            user_data["photo_path"] = file_path
-            logger.info(f"Photo saved: {user_data['photo_path']}")
-        else:
-            logger.error("Failed to download photo")
-            await message.answer("Не удалось скачать прикрепленное фото.")
+            logger.info("Photo detected: file_id=%s", file_id)
+
+    # Документ скачиваем с оригинальным именем, для фото имя с расширением .jpg добавляется в download_file;
+    # части альбома скачиваются параллельно
+    downloads = await download_files(message.bot, [
+        (file_id, file_type, (file_name or "document") if file_type == "document" else f"photo_{file_id[:8]}")
+        for _, (file_id, file_type, file_name) in files
+    ])
+    for (_, (file_id, file_type, file_name)), downloaded in zip(files, downloads):
+        is_document = file_type == "document"
+        name = (file_name or "document") if is_document else None
+        stored = await store_file(downloaded, name) if downloaded else None
+        if not stored:
+            logger.error("Failed to download %s", file_type)
+            await message.answer("Не удалось скачать прикрепленный документ." if is_document
+                                 else "Не удалось скачать прикрепленное фото.")
+            continue
+        path_key = "document_path" if is_document else "photo_path"
+        if user_data[path_key] is None:
+            user_data[path_key] = stored.path
+        user_data["attachments"].append(stored.sha256)
+        user_data["files"].append({"path": stored.path, "file_id": file_id, "file_type": file_type})
+        logger.info("%s saved: %s", file_type.capitalize(), stored.path)
 
     # Сохраняем данные в FSM
     await state.update_data(**user_data)
 
     # Запрашиваем email пользователя
-    await message.answer(
-        "Введите email пользователя (или нажмите 'Пропустить'):",
-        reply_markup=get_keyboard(("❌ Отмена", "cancel"), ("⏭ Пропустить", "skip_email"))
-    )
+    await message.answer(replies.ASK_FORWARDED_EMAIL.text, reply_markup=replies.ASK_FORWARDED_EMAIL.markup)
     await SupportStates.GET_EMAIL_FORWARDED.set()
 
 # Обработчик кнопки "Пропустить"
@@ -189,6 +210,7 @@ async def get_forwarded_email(message: types.Message, state: FSMContext):
     await process_forwarded_request(message, state)
 
 # Обработка заявки
+@timed("process_forwarded_request")
 async def process_forwarded_request(message: types.Message, state: FSMContext):
     try:
         data = await state.get_data()
@@ -201,92 +223,31 @@ async def process_forwarded_request(message: types.Message, state: FSMContext):
 
         # Отправляем письмо
         # Формируем список вложений
-        attachments = []
-        if data.get('document_path') and os.path.exists(data['document_path']):
-            attachments.append(data['document_path'])
-            logger.info(f"Adding document to attachments: {data['document_path']}")
-        if data.get('photo_path') and os.path.exists(data['photo_path']):
-            attachments.append(data['photo_path'])
-            logger.info(f"Adding photo to attachments: {data['photo_path']}")
-
-        # Отправляем письмо с вложениями
+        if 'files' in data:
+            attachments = [file['path'] for file in data['files'] if os.path.exists(file['path'])]
+            logger.info("Adding files to attachments: %s", attachments)
+        else:
+            # Данные FSM, сохраненные до поддержки альбомов
+            attachments = []
+            if data.get('document_path') and os.path.exists(data['document_path']):
+                attachments.append(data['document_path'])
+                logger.info("Adding document to attachments: %s", data['document_path'])
+            if data.get('photo_path') and os.path.exists(data['photo_path']):
+                attachments.append(data['photo_path'])
+                logger.info("Adding photo to attachments: %s", data['photo_path'])
+
+        # Отправляем письмо с вложениями; ответ сотруднику не ждет отправки (и окна дайджеста)
         email_text = format_email_text(data)
-        send_email(
+        await send_ticket_email(
             subject="Вопрос от пользователя через чат ГИС “Платформа “ЦХЭД”",
             body=email_text,
             to_emails=EMAIL_RECEIVER,
-            is_html=True,
-            attachments=attachments
+            attachments=attachments,
+            wait=False
         )
 
         await message.answer("Ваша заявка отправлена. Спасибо!")
-
-        # Очистка временных файлов
-        logger.info(f"Отправка вложений: {attachments}")
-        for file_path in attachments:
-            logger.info(f"Имя файла: {os.path.basename(file_path)}")
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Удален временный файл: {file_path}")
-            except Exception as e:
-                logger.error(f"Ошибка удаления файла: {str(e)}")
+        # Файлы остаются в хранилище вложений: их могут использовать и другие заявки,
+        # удаляет их фоновая очистка по сроку хранения и квоте
     finally:
         await state.finish()
-
-
-# Обработчик кнопки "Отмена"
-async def cancel_handler(callback: types.CallbackQuery, state: FSMContext):
-    await state.finish()
-    await callback.message.edit_text("Операция отменена.")
-    await callback.message.answer(
-        "Используйте команду /support, чтобы отправить заявку в техническую поддержку.",
-        reply_markup=None
-    )
-    await callback.answer()
-
-# Функция для скачивания файла
-bot = Bot(token=TELEGRAM_TOKEN)
-
-
-async def download_file(file_id: str, file_type: str, original_name: str = None) -> str:
-    #Скачивает и сохраняет файл из Telegram с правильным именем
-    try:
-        # Генерируем временную метку
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # Получаем информацию о файле
-        file = await bot.get_file(file_id)
-        file_url = f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file.file_path}"
-
-        # Определяем базовое имя файла
-        if file_type == "document" and original_name:
-            # Убираем запрещенные символы в имени файла для документов
-            clean_name = re.sub(r'[\\/*?:"<>|]', "", original_name)
-            base_name = f"{timestamp}_{clean_name}"
-        elif file_type == "photo":
-            # Для фото добавляем расширение .jpg
-            clean_name = re.sub(r'[\\/*?:"<>|]', "", original_name or f"photo_{file_id[:8]}")
-            base_name = f"{timestamp}_{clean_name}.jpg"
-        else:
-            # Извлекаем расширение из file_path, если есть
-            ext = os.path.splitext(file.file_path)[1] if '.' in file.file_path else ''
-            base_name = f"{file_type}_{timestamp}_{file_id[:8]}{ext}"
-
-        file_path = os.path.join(TEMP_DIR, base_name)
-
-        # Скачиваем файл
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
-                    logger.info(f"Файл сохранен как: {file_path}")
-                    return file_path
-                logger.error(f"Ошибка загрузки: {response.status}")
-        return None
-    except Exception as e:
-        logger.error(f"Ошибка загрузки файла: {str(e)}")
-        return None
-
@@ -0,0 +1,125 @@
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+from aiogram import types
+from aiogram.dispatcher import FSMContext
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from date.config import ADMIN_IDS, TICKET_PAGE_SIZE, SEARCH_MAX_RESULTS, SEARCH_CACHE_TTL
+from handlers.tickets import page_cache
+from keyboards.replies import Reply, freeze
+from utils.database import get_connection
+from utils.callback_router import pack
+
+logger = logging.getLogger(__name__)
+
+# Ранжируются только последние SEARCH_MAX_RESULTS совпадений: время ответа не растет вместе с таблицей
+_SEARCH_QUERY = """
+    SELECT id FROM (
+        SELECT id, search_vector FROM support_requests
+        WHERE search_vector @@ websearch_to_tsquery('russian', $1)
+        ORDER BY created_at DESC NULLS LAST, id DESC
+        LIMIT $2
+    ) candidates
+    ORDER BY ts_rank_cd(search_vector, websearch_to_tsquery('russian', $1)) DESC, id DESC
+"""
+
+# Фрагменты с подсветкой строятся только для заявок показываемой страницы
+_PAGE_QUERY = """
+    SELECT id, name, user_username, created_at,
+           ts_headline('russian', coalesce(message, ''), websearch_to_tsquery('russian', $1),
+                       'MaxWords=20, MinWords=8, StartSel=«, StopSel=»') AS snippet
+    FROM support_requests WHERE id = ANY($2::int[])
+"""
+
+
+def query_token(query: str) -> str:
+    # Короткий ключ запроса для callback_data (лимит Telegram - 64 байта)
+    return hashlib.blake2s(query.encode(), digest_size=6).hexdigest()
+
+
+async def find(query: str) -> Tuple[str, List[int]]:
+    # Возвращает ключ запроса и ранжированный список id заявок; результат кэшируется
+    token = query_token(query)
+    cached = page_cache.get(("search", token))
+    if cached is not None:
+        return token, cached[1]
+    async with get_connection() as conn:
+        ids = [row["id"] for row in await conn.fetch(_SEARCH_QUERY, query, SEARCH_MAX_RESULTS)]
+    # Результаты поиска живут дольше страниц, чтобы их можно было спокойно пролистать
+    page_cache.put(("search", token), (query, ids), SEARCH_CACHE_TTL)
+    return token, ids
+
+
+async def render_page(token: str, page: int) -> Optional[Reply]:
+    key = ("search_page", token, page)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return cached
+    found = page_cache.get(("search", token))
+    if found is None:
+        return None
+    query, ids = found
+    total_pages = max((len(ids) + TICKET_PAGE_SIZE - 1) // TICKET_PAGE_SIZE, 1)
+    page_ids = ids[page * TICKET_PAGE_SIZE:(page + 1) * TICKET_PAGE_SIZE]
+
+    title = f"🔍 Поиск: {query}"
+    if not page_ids:
+        return page_cache.put(key, Reply(f"{title}\n\nНичего не найдено."))
+
+    async with get_connection() as conn:
+        rows = {row["id"]: row for row in await conn.fetch(_PAGE_QUERY, query, page_ids)}
+    more = "+" if len(ids) >= SEARCH_MAX_RESULTS else ""
+    lines = [f"{title}\nНайдено: {len(ids)}{more}, страница {page + 1} из {total_pages}", ""]
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    for request_id in page_ids:
+        row = rows.get(request_id)
+        if row is None:
+            continue
+        created = f"{row['created_at']:%d.%m.%Y}" if row["created_at"] else "—"
+        lines.append(f"#{request_id} · {created} · {row['name'] or '—'} (@{row['user_username'] or 'Не указан'})\n"
+                     f"{' '.join(row['snippet'].split())}")
+        keyboard.insert(InlineKeyboardButton(f"🔎 #{request_id}", callback_data=pack("view", request_id)))
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=pack("search", token, page - 1)))
+    if page + 1 < total_pages:
+        navigation.append(InlineKeyboardButton("Далее ▶️", callback_data=pack("search", token, page + 1)))
+    if navigation:
+        keyboard.row(*navigation)
+    return page_cache.put(key, Reply("\n".join(lines), freeze(keyboard)))
+
+
+# Обработчики
+async def search_command(message: types.Message) -> None:
+    # /search <запрос> - полнотекстовый поиск по имени и тексту заявок
+    query = " ".join(message.get_args().split())
+    if not query:
+        await message.answer("Использование: /search <текст запроса>")
+        return
+    try:
+        token, _ = await find(query)
+        reply = await render_page(token, 0)
+    except Exception as e:
+        logger.error("Ошибка поиска заявок по запросу %r: %s", query, e)
+        await message.answer("❌ Ошибка поиска. Попробуйте позже.")
+        return
+    await message.answer(reply.text, reply_markup=reply.markup)
+
+
+async def page_callback(callback: types.CallbackQuery, state: FSMContext, token: str, page: int) -> None:
+    # Листает результаты поиска: search:<ключ запроса>:<страница>
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    if page < 0:
+        # Отрицательная страница дала бы отрицательный OFFSET
+        logger.warning("Некорректные данные пагинации: %s", callback.data)
+        await callback.answer("Некорректный запрос")
+        return
+    reply = await render_page(token, page)
+    if reply is None:
+        await callback.answer("Результаты поиска устарели, повторите /search", show_alert=True)
+        return
+    if callback.message.text != reply.text:
+        await callback.message.edit_text(reply.text, reply_markup=reply.markup)
+    await callback.answer()
@@ -1,7 +1,7 @@
 from aiogram import types
-from aiogram.types import InputFile
 from middlewares.rate_limit import rate_limit
-from keyboards import inline
+from keyboards import replies
+from utils.media_cache import media_cache, WELCOME_PHOTO
 
 #
 # async def start(massage: types.Message):
@@ -11,16 +11,8 @@ from keyboards import inline
 
 @rate_limit(limit=10, key='/start')
 async def start(message: types.Message):
-    photo = "./img/tshed_logo.jpg"
-
-    # Текст сообщения
-    welcome_text = (
-        "\n\n👋 Привет! Я бот технической поддержки ЦХЭД.\n\n"
+    # Отправляем изображение и текст (изображение - по закэшированному file_id, клавиатура - готовый JSON)
+    await media_cache.send_photo(
+        message.bot, message.chat.id, WELCOME_PHOTO,
+        caption=replies.WELCOME.text, reply_markup=replies.WELCOME.markup
     )
-
-    # Отправляем изображение и текст
-    with open(photo, "rb") as photo:
-        await message.answer_photo(
-            photo=InputFile(photo),
-            caption=welcome_text, reply_markup=inline.get_keyboard_start_menu()
-        )
\ No newline at end of file
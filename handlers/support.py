@@ -1,70 +1,93 @@
-import os
-import re
+import asyncio
 import logging
-import datetime
-import aiohttp
-from typing import Optional
+from typing import List, Optional
 from aiogram import types, Bot
+from aiogram.types import InputFile
 from aiogram.dispatcher import FSMContext
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.email_sender import send_email
+from utils.email_digest import send_ticket_email
 from utils.valid_email import is_valid_email
-from utils.database import create_connection
-from date.config import ADMIN_IDS, TELEGRAM_TOKEN, EMAIL_RECEIVER
+from utils.database import get_connection
+from utils.downloader import download_files
+from utils.attachments import attachment_store
+from utils import outbox
+from utils.ticket_batcher import ticket_batcher, TICKET_COLUMNS
+from utils.fanout import fan_out, fan_out_file, limited_call, sent_file_id
+from utils.metrics import timed
+from utils.media_group import media_groups, message_file, send_album
+from date.config import ADMIN_IDS, EMAIL_RECEIVER, TICKET_BATCHING
 from states import user_state, admin_state
-from keyboards import inline
+from keyboards import replies
+from handlers import tickets
 
 # Константы
-TEMP_DIR = "temp_files"
-os.makedirs(TEMP_DIR, exist_ok=True)
+# Типы задач outbox для заявки
+OUTBOX_NOTIFY_ADMINS = "support.notify_admins"
+OUTBOX_EMAIL = "support.email"
 
-CONSENT_TEXT = (
-    "Вы даете согласие на обработку персональных данных?\n\n"
-    "[Политика в отношении обработки и защиты персональных данных]"
-    "(https://platform-eadsc.voskhod.ru/docs_back/personal_data_processing_policy.pdf)"
-)
+# Переходы по кнопке "Назад": состояние -> (предыдущее состояние, ответ)
+BACK_TRANSITIONS = {
+    'SupportStates:GET_EMAIL': (user_state.SupportStates.GET_NAME, replies.ASK_NAME),
+    'SupportStates:GET_MESSAGE': (user_state.SupportStates.GET_EMAIL, replies.ASK_EMAIL),
+    'SupportStates:GET_FILE': (user_state.SupportStates.GET_MESSAGE, replies.ASK_PROBLEM),
+}
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = Bot(token=TELEGRAM_TOKEN)
-
-# Утилиты
-def create_consent_keyboard() -> InlineKeyboardMarkup:
-    # Создает клавиатуру с вариантами согласия на обработку данных
-    return InlineKeyboardMarkup(row_width=2).add(
-        InlineKeyboardButton("✅ Согласен", callback_data="consent_yes"),
-        InlineKeyboardButton("❌ Отмена", callback_data="cancel")
-    )
-
-def sanitize_filename(filename: str) -> str:
-    # Очищает имя файла от недопустимых символов
-    return re.sub(r'[\\/*?:"<>|]', "_", filename)
-
-
 # Обработка данных
 async def save_support_request(user_id: int, user_data: dict, username: str, problem: str,
-                               document_path: Optional[str] = None) -> None:
-    # Сохраняет данные в базу данных
-    conn = await create_connection()
+                               document_path: Optional[str] = None) -> int:
+    # Сохраняет заявку и задачи на уведомления (outbox) в одной транзакции
+    payload = {
+        "user_id": user_id,
+        "username": username,
+        "name": user_data['name'],
+        "email": user_data['email'],
+        "problem": problem,
+        "document_path": document_path,
+        "file_id": user_data.get("file_id"),
+        "file_type": user_data.get("file_type", "document"),
+    }
+    files = user_data.get("files") or []
+    if len(files) > 1:
+        # Альбом: все файлы уходят администраторам и в письмо
+        payload["files"] = [{key: file[key] for key in ("path", "file_id", "file_type")} for file in files]
+    is_photo = payload["file_type"] == "photo"
+    document_id = None if is_photo else payload["file_id"]
+    photo_id = payload["file_id"] if is_photo else None
+    row = (user_id, user_data['name'], username, user_data['email'], problem,
+           None if is_photo else document_path, document_path if is_photo else None, document_id, photo_id)
+    # Файлы из хранилища вложений связываются с заявкой в той же транзакции
+    if files:
+        attachments = [file["sha256"] for file in files]
+    else:
+        attachments = [user_data["document_sha256"]] if document_path and user_data.get("document_sha256") else []
+    if TICKET_BATCHING:
+        # Заявка записывается пакетом вместе с другими; id возвращается после коммита
+        return await ticket_batcher.submit(row, payload, (OUTBOX_NOTIFY_ADMINS, OUTBOX_EMAIL), attachments)
     try:
-        await conn.execute(
-            "INSERT INTO support_requests (user_id, name, user_username, email, message, document_path) "
-            "VALUES ($1, $2, $3, $4, $5, $6)",
-            user_id, user_data['name'], username, user_data['email'], problem, document_path
-        )
+        async with get_connection() as conn:
+            async with conn.transaction():
+                request_id = await conn.fetchval(
+                    f"INSERT INTO support_requests ({', '.join(TICKET_COLUMNS)}) "
+                    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) RETURNING id",
+                    *row
+                )
+                await attachment_store.link(conn, request_id, attachments)
+                payload["request_id"] = request_id
+                await outbox.enqueue(conn, OUTBOX_NOTIFY_ADMINS, payload)
+                await outbox.enqueue(conn, OUTBOX_EMAIL, payload)
     except Exception as e:
-        logger.error(f"Ошибка сохранения в БД: {e}")
+        logger.error("Ошибка сохранения в БД: %s", e)
         raise
-    finally:
-        await conn.close()
+    outbox.outbox_dispatcher.wake()
+    return request_id
 
 
 async def notify_admins(bot: Bot, user_data: dict, user_id: int, username: str, problem: str,
-                        document_path: Optional[str] = None) -> None:
-    # Уведомляет администраторов о новой заявке
+                        document_path: Optional[str] = None, admin_ids: Optional[List[int]] = None,
+                        file_id: Optional[str] = None, file_type: str = "document",
+                        request_id: Optional[int] = None, files: Optional[List[dict]] = None) -> List[int]:
+    # Уведомляет администраторов о новой заявке, возвращает список тех, кого уведомить не удалось
     admin_text = (
         f"🚨 Новая заявка в поддержку!\n"
         f"👤 Пользователь: {user_id}\n"
@@ -73,22 +96,44 @@ async def notify_admins(bot: Bot, user_data: dict, user_id: int, username: str,
         f"📧 Email: {user_data['email']}\n"
         f"📝 Сообщение:\n{problem}"
     )
-    keyboard = InlineKeyboardMarkup(row_width=1).add(
-        InlineKeyboardButton("✉️ Ответить", callback_data=f"reply_{user_id}")
-    )
-    for admin in ADMIN_IDS:
-        try:
-            await bot.send_message(admin, admin_text, reply_markup=keyboard)
-            if document_path:
-                with open(document_path, 'rb') as file:
-                    await bot.send_document(admin, file)
-            logger.info(f"Уведомление отправлено администратору {admin}")
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления администратору {admin}: {e}")
+    keyboard = replies.admin_reply_markup(user_id, request_id)
+    send_file = bot.send_photo if file_type == "photo" else bot.send_document
+
+    async def send(admin: int, cached_file_id: Optional[str]) -> Optional[str]:
+        await limited_call(admin, lambda: bot.send_message(admin, admin_text, reply_markup=keyboard))
+        if cached_file_id:
+            # Файл уже есть на серверах Telegram - отправляем по file_id без загрузки
+            await limited_call(admin, lambda: send_file(admin, cached_file_id))
+            return cached_file_id
+        if document_path:
+            sent = await limited_call(admin, lambda: send_file(admin, InputFile(document_path)))
+            return sent_file_id(sent)
+        return None
+
+    async def send_with_album(admin: int) -> None:
+        # Альбом уже загружен пользователем в Telegram - отправляем по file_id
+        await limited_call(admin, lambda: bot.send_message(admin, admin_text, reply_markup=keyboard))
+        await send_album(bot, admin, files)
+
+    admins = ADMIN_IDS if admin_ids is None else admin_ids
+    if files:
+        results = await fan_out(admins, send_with_album)
+    elif file_id or not document_path:
+        results = await fan_out(admins, lambda admin: send(admin, file_id))
+    else:
+        results = await fan_out_file(admins, send)
+    failed = []
+    for admin, result in results.items():
+        if result.ok:
+            logger.info("Уведомление отправлено администратору %s", admin)
+        else:
+            logger.error("Ошибка отправки уведомления администратору %s: %s", admin, result.error)
+            failed.append(admin)
+    return failed
 
 
 async def send_email_confirmation(user_data: dict, user_id: int, username: str, problem: str,
-                                  document_path: Optional[str] = None) -> None:
+                                  document_path: Optional[str] = None, files: Optional[List[dict]] = None) -> None:
     # Отправляет email с подтверждением заявки
     email_text = (
         f"Пользователь оставил запрос в техническую поддержку через чат.<br><br>"
@@ -98,50 +143,39 @@ async def send_email_confirmation(user_data: dict, user_id: int, username: str,
         f"Ссылка в tg: <b>https://t.me/{username or 'Не_указан'}</b><br>"
         f"Текст обращения: <b>{problem}</b>"
     )
-    attachments = [document_path] if document_path else None
-    try:
-        send_email("Вопрос от пользователя через чат ГИС “Платформа “ЦХЭД”", body=email_text, to_emails=EMAIL_RECEIVER, is_html=True,
-                   attachments=attachments)
-        logger.info("Email с подтверждением отправлен")
-    except Exception as e:
-        logger.error(f"Ошибка отправки email: {e}")
-        raise
+    if files:
+        attachments = [file["path"] for file in files]
+    else:
+        attachments = [document_path] if document_path else None
+    # При EMAIL_DIGEST письмо может уйти в составе дайджеста; ошибка отправки приводит к повтору из outbox
+    sent = await send_ticket_email("Вопрос от пользователя через чат ГИС “Платформа “ЦХЭД”", body=email_text,
+                                   to_emails=EMAIL_RECEIVER, attachments=attachments)
+    if not sent:
+        raise RuntimeError("Не удалось отправить email с подтверждением")
+    logger.info("Email с подтверждением отправлен")
+
+
+# Доставка задач из outbox (выполняется фоновым диспетчером)
+@outbox.outbox_handler(OUTBOX_NOTIFY_ADMINS)
+async def deliver_admin_notification(bot: Bot, payload: dict) -> None:
+    failed = await notify_admins(
+        bot, payload, payload["user_id"], payload["username"], payload["problem"],
+        payload.get("document_path"), admin_ids=payload.get("admin_ids"),
+        file_id=payload.get("file_id"), file_type=payload.get("file_type", "document"),
+        request_id=payload.get("request_id"), files=payload.get("files")
+    )
+    if failed:
+        raise outbox.RetryLater(f"Не уведомлены администраторы: {failed}", {**payload, "admin_ids": failed})
 
 
-async def download_file(file_id: str, file_type: str, original_name: Optional[str] = None) -> Optional[str]:
-    # Скачивает файл из Telegram и сохраняет его локально
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    try:
-        file = await bot.get_file(file_id)
-        file_url = f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file.file_path}"
-
-        if file_type == "document" and original_name:
-            clean_name = sanitize_filename(original_name)
-            base_name = f"{timestamp}_{clean_name}"
-        elif file_type == "photo":
-            clean_name = sanitize_filename(original_name or f"photo_{file_id[:8]}")
-            base_name = f"{timestamp}_{clean_name}.jpg"
-        else:
-            ext = os.path.splitext(file.file_path)[1] if '.' in file.file_path else ''
-            base_name = f"{file_type}_{timestamp}_{file_id[:8]}{ext}"
-
-        file_path = os.path.join(TEMP_DIR, base_name)
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
-                    logger.info(f"Файл сохранен: {file_path}")
-                    return file_path
-                logger.error(f"Ошибка загрузки файла, статус: {response.status}")
-                return None
-    except Exception as e:
-        logger.error(f"Ошибка при скачивании файла: {e}")
-        return None
+@outbox.outbox_handler(OUTBOX_EMAIL)
+async def deliver_email_confirmation(bot: Bot, payload: dict) -> None:
+    await send_email_confirmation(payload, payload["user_id"], payload["username"], payload["problem"],
+                                  payload.get("document_path"), payload.get("files"))
 
 
 # Обработка заявок
+@timed("process_support_request")
 async def process_support_request(message_or_callback: types.Message | types.CallbackQuery, state: FSMContext) -> None:
     # Обрабатывает заявку на поддержку
     user_data = await state.get_data()
@@ -149,19 +183,17 @@ async def process_support_request(message_or_callback: types.Message | types.Cal
     username = message_or_callback.from_user.username
     problem = user_data.get("problem")
     document_path = user_data.get("document_path")
-    bot_instance = message_or_callback.bot
 
     try:
+        # Уведомления администраторам и email доставляются диспетчером outbox после коммита
         await save_support_request(user_id, user_data, username, problem, document_path)
-        await notify_admins(bot_instance, user_data, user_id, username, problem, document_path)
-        await send_email_confirmation(user_data, user_id, username, problem, document_path)
 
         if isinstance(message_or_callback, types.CallbackQuery):
             await message_or_callback.message.edit_text("Ваша заявка отправлена. Спасибо!")
         else:
             await message_or_callback.answer("Ваша заявка отправлена. Спасибо!")
     except Exception as e:
-        logger.error(f"Ошибка обработки заявки: {e}")
+        logger.error("Ошибка обработки заявки: %s", e)
         error_message = "Ошибка при отправке заявки. Попробуйте снова."
         if isinstance(message_or_callback, types.CallbackQuery):
             await message_or_callback.message.edit_text(error_message)
@@ -175,25 +207,22 @@ async def process_support_request(message_or_callback: types.Message | types.Cal
 async def start_support(callback: types.CallbackQuery, state: FSMContext) -> None:
     # Начинает процесс заполнения заявки
     await callback.answer()
-    await callback.message.answer(CONSENT_TEXT, reply_markup=create_consent_keyboard(),
-                                  parse_mode=types.ParseMode.MARKDOWN)
+    consent = replies.CONSENT_REQUEST
+    await callback.message.answer(consent.text, reply_markup=consent.markup, parse_mode=consent.parse_mode)
     await state.set_state(user_state.SupportStates.GET_CONSENT)
 
 
 async def handle_consent(callback: types.CallbackQuery, state: FSMContext) -> None:
-    # Обрабатывает выбор пользователя по согласию на обработку данных
-    if callback.data == "consent_yes":
-        await callback.message.edit_text("Пожалуйста, введите ваше имя:", reply_markup=inline.cancel_keyboard_support())
-        await state.set_state(user_state.SupportStates.GET_NAME)
-    else:
-        await cancel_handler(callback, state)
+    # Обрабатывает согласие на обработку данных (отказ - общая кнопка "Отмена")
+    await callback.message.edit_text(replies.ASK_NAME.text, reply_markup=replies.ASK_NAME.markup)
+    await state.set_state(user_state.SupportStates.GET_NAME)
     await callback.answer()
 
 
 async def get_name(message: types.Message, state: FSMContext) -> None:
     # Получает имя пользователя и переходит к следующему шагу
     await state.update_data(name=message.text)
-    await message.answer("Введите ваш email:", reply_markup=inline.get_back_cancel_keyboard())
+    await message.answer(replies.ASK_EMAIL.text, reply_markup=replies.ASK_EMAIL.markup)
     await state.set_state(user_state.SupportStates.GET_EMAIL)
 
 
@@ -203,33 +232,27 @@ async def get_email(message: types.Message, state: FSMContext) -> None:
         is_valid, error_message = is_valid_email(message.text)
 
         if not is_valid:
-            logger.info(f"Некорректный email: {message.text}. Причина: {error_message}")
+            logger.info("Некорректный email: %s. Причина: %s", message.text, error_message)
             await message.answer(
                 f"❌ {error_message}\nПожалуйста, введите корректный email:",
-                reply_markup=inline.get_back_cancel_keyboard()
+                reply_markup=replies.BACK_CANCEL
             )
             return
 
         # Если email корректный, сохраняем его и переходим к следующему шагу
-        logger.info(f"Email прошел валидацию: {message.text}")
+        logger.info("Email прошел валидацию: %s", message.text)
         await state.update_data(email=message.text.strip().lower())
-        await message.answer(
-            "Опишите вашу проблему:",
-            reply_markup=inline.get_back_cancel_keyboard()
-        )
+        await message.answer(replies.ASK_PROBLEM.text, reply_markup=replies.ASK_PROBLEM.markup)
         await state.set_state(user_state.SupportStates.GET_MESSAGE)
 
     except Exception as e:
-        logger.error(f"Ошибка при обработке email: {e}")
-        await message.answer(
-            "Произошла ошибка при проверке email. Пожалуйста, попробуйте еще раз:",
-            reply_markup=inline.get_back_cancel_keyboard()
-        )
+        logger.error("Ошибка при обработке email: %s", e)
+        await message.answer(replies.EMAIL_CHECK_ERROR.text, reply_markup=replies.EMAIL_CHECK_ERROR.markup)
 
 async def get_message(message: types.Message, state: FSMContext) -> None:
     # Получает сообщение пользователя и переходит к следующему шагу
     await state.update_data(problem=message.text)
-    await message.answer("Хотите прикрепить файл к заявке?", reply_markup=inline.get_yes_no_keyboard_support())
+    await message.answer(replies.ASK_FILE.text, reply_markup=replies.ASK_FILE.markup)
     await state.set_state(user_state.SupportStates.GET_FILE)
 
 
@@ -244,54 +267,94 @@ async def handle_file_choice(callback: types.CallbackQuery, state: FSMContext) -
 
 
 async def upload_file(message: types.Message, state: FSMContext) -> None:
-    # Обрабатывает загрузку файла от пользователя
-    logger.info(f"Получено сообщение в состоянии GET_FILE_UPLOAD от {message.from_user.id}")
-
-    if message.document:
-        file_id, file_type, original_name = message.document.file_id, "document", message.document.file_name
-        logger.info(f"Обработка документа: {original_name}")
-    elif message.photo:
-        file_id, file_type, original_name = message.photo[-1].file_id, "photo", None
-        logger.info("Обработка фото")
-    else:
-        logger.warning(f"Сообщение не содержит документ или фото: {message.content_type}")
+    # Обрабатывает загрузку файла или альбома от пользователя
+    logger.info("Получено сообщение в состоянии GET_FILE_UPLOAD от %s", message.from_user.id)
+
+    messages = await media_groups.collect(message)
+    if messages is None:
+        # Часть альбома: заявку со всеми файлами создает обработчик первой части
+        return
+    files = [file for file in map(message_file, messages) if file]
+    if not files:
+        logger.warning("Сообщение не содержит документ или фото: %s", message.content_type)
         await message.answer("Пожалуйста, отправьте файл или фото.")
         return
+    logger.info("Обработка вложений: %s", len(files))
 
-    file_path = await download_file(file_id, file_type, original_name)
-    if not file_path:
-        logger.error("Не удалось скачать файл")
+    # Части альбома скачиваются параллельно (число одновременных загрузок ограничено)
+    downloads = await download_files(message.bot, files)
+    if not all(downloads):
+        logger.error("Не удалось скачать файлы: %s из %s", downloads.count(None), len(files))
         await message.answer("Ошибка при загрузке файла. Попробуйте снова.")
         return
 
-    await state.update_data(document_path=file_path)
-    logger.info(f"Файл сохранен, путь: {file_path}, обработка заявки начинается")
+    try:
+        # Одинаковые файлы от разных пользователей хранятся в одном экземпляре
+        stored = await asyncio.gather(*(
+            attachment_store.put(downloaded, original_name)
+            for downloaded, (_, _, original_name) in zip(downloads, files)
+        ))
+    except Exception as e:
+        logger.error("Ошибка сохранения файла в хранилище вложений: %s", e)
+        await message.answer("Ошибка при загрузке файла. Попробуйте снова.")
+        return
+
+    # file_id сохраняем, чтобы пересылать вложения администраторам без повторной загрузки
+    attached = [
+        {"path": item.path, "sha256": item.sha256, "file_id": file_id, "file_type": file_type}
+        for item, (file_id, file_type, _) in zip(stored, files)
+    ]
+    first = attached[0]
+    await state.update_data(document_path=first["path"], file_id=first["file_id"], file_type=first["file_type"],
+                            document_sha256=first["sha256"], files=attached)
+    logger.info("Файлы сохранены: %s, обработка заявки начинается", len(attached))
     await process_support_request(message, state)
 
 
 # Обработчики администратора
-async def handle_admin_callback(callback: types.CallbackQuery, state: FSMContext) -> None:
-    # Обрабатывает запросы от администратора
-    action, data = callback.data.split("_")
-    if action == "reply":
-        await state.update_data(target_user_id=data)
-        await callback.message.answer("Введите ваш ответ:")
-        await admin_state.AdminStates.WAITING_FOR_REPLY.set()
-    elif action == "view":
-        await callback.answer("Заявка будет показана здесь", show_alert=True)
+async def reply_to_user(callback: types.CallbackQuery, state: FSMContext, user_id: int,
+                        request_id: Optional[int] = None) -> None:
+    # Кнопка "Ответить" без номера заявки (reply_user:<user_id>, прежний формат reply_<user_id>)
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    await state.update_data(target_user_id=user_id, target_request_id=request_id)
+    await callback.message.answer("Введите ваш ответ:")
+    await admin_state.AdminStates.WAITING_FOR_REPLY.set()
     await callback.answer()
 
 
+async def reply_to_ticket(callback: types.CallbackQuery, state: FSMContext, request_id: int) -> None:
+    # Кнопка "Ответить" по заявке (reply:<request_id>): ответ сохраняется в support_responses
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    async with get_connection() as conn:
+        user_id = await conn.fetchval("SELECT user_id FROM support_requests WHERE id = $1", request_id)
+    if user_id is None:
+        await callback.answer(f"У заявки #{request_id} нет пользователя Telegram", show_alert=True)
+        return
+    await reply_to_user(callback, state, user_id, request_id)
+
+
 async def handle_admin_reply(message: types.Message, state: FSMContext) -> None:
     # Обрабатывает ответ администратора на заявку
     user_data = await state.get_data()
     target_user_id = user_data.get("target_user_id")
+    request_id = user_data.get("target_request_id")
     try:
         await message.bot.send_message(target_user_id, f"📨 Ответ от поддержки:\n\n{message.text}")
+        if request_id is not None:
+            async with get_connection() as conn:
+                await conn.execute(
+                    "INSERT INTO support_responses (request_id, admin_id, message) VALUES ($1, $2, $3)",
+                    request_id, message.from_user.id, message.text
+                )
+            tickets.page_cache.invalidate(("ticket", request_id))
         await message.answer("✅ Ответ успешно отправлен!")
     except Exception as e:
         await message.answer("❌ Ошибка отправки ответа")
-        logger.error(f"Ошибка отправки ответа: {e}")
+        logger.error("Ошибка отправки ответа: %s", e)
     finally:
         await state.finish()
 
@@ -300,49 +363,28 @@ async def handle_admin_reply(message: types.Message, state: FSMContext) -> None:
 async def back_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
     # Обрабатывает кнопку "Назад"
     current_state = await state.get_state()
-    logger.info(f"Обработка кнопки 'Назад' из состояния: {current_state}")
-
-    # Маппинг состояний и их обработчиков
-    state_handlers = {
-        'SupportStates:GET_EMAIL': {
-            'target_state': user_state.SupportStates.GET_NAME,
-            'message': "Пожалуйста, введите ваше имя:",
-            'keyboard': inline.cancel_keyboard_support()
-        },
-        'SupportStates:GET_MESSAGE': {
-            'target_state': user_state.SupportStates.GET_EMAIL,
-            'message': "Введите ваш email:",
-            'keyboard': inline.get_back_cancel_keyboard()
-        },
-        'SupportStates:GET_FILE': {
-            'target_state': user_state.SupportStates.GET_MESSAGE,
-            'message': "Опишите вашу проблему:",
-            'keyboard': inline.get_back_cancel_keyboard()
-        }
-    }
+    logger.info("Обработка кнопки 'Назад' из состояния: %s", current_state)
 
     try:
-        if current_state in state_handlers:
-            handler = state_handlers[current_state]
+        transition = BACK_TRANSITIONS.get(current_state)
+        if transition is not None:
+            target_state, reply = transition
             # Сохраняем текущие данные
             current_data = await state.get_data()
             # Устанавливаем новое состояние
-            await handler['target_state'].set()
+            await target_state.set()
             # Восстанавливаем данные в новом состоянии
             await state.update_data(**current_data)
             # Обновляем сообщение
-            await callback.message.edit_text(
-                handler['message'],
-                reply_markup=handler['keyboard']
-            )
-            logger.info(f"Переход из {current_state} в состояние: {handler['target_state'].state}")
+            await callback.message.edit_text(reply.text, reply_markup=reply.markup)
+            logger.info("Переход из %s в состояние: %s", current_state, target_state.state)
         else:
-            logger.warning(f"Неожиданное состояние для кнопки 'Назад': {current_state}")
+            logger.warning("Неожиданное состояние для кнопки 'Назад': %s", current_state)
             await callback.answer("Действие недоступно в текущем состоянии")
             return
 
     except Exception as e:
-        logger.error(f"Ошибка при обработке кнопки 'Назад': {e}")
+        logger.error("Ошибка при обработке кнопки 'Назад': %s", e)
         await callback.answer("Произошла ошибка. Попробуйте отменить и начать заново.")
         return
 
@@ -0,0 +1,223 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+from aiogram import types
+from aiogram.dispatcher import FSMContext
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from date.config import ADMIN_IDS, TICKET_PAGE_SIZE, TICKET_PAGE_CACHE_TTL
+from keyboards.replies import Reply, freeze
+from utils.database import get_connection
+from utils.callback_router import pack
+
+logger = logging.getLogger(__name__)
+
+# Фильтры списка заявок: тип -> колонка support_requests
+FILTERS = {"all": None, "user": "user_id", "admin": "admin_id"}
+
+# Курсор страницы (created_at, id) передается в callback_data как число микросекунд от эпохи
+_EPOCH = datetime(1970, 1, 1)
+Cursor = Optional[Tuple[datetime, int]]
+
+
+def encode_cursor(created_at: datetime) -> int:
+    return (created_at - _EPOCH) // timedelta(microseconds=1)
+
+
+def decode_cursor(micros: int, request_id: int) -> Cursor:
+    if micros == 0:
+        return None
+    return _EPOCH + timedelta(microseconds=micros), request_id
+
+
+def _page_query(column: Optional[str], with_cursor: bool) -> str:
+    # Условия собираются из фиксированных вариантов, чтобы у каждого был свой план с индексом
+    conditions, args = ["created_at IS NOT NULL"], 1
+    if column:
+        conditions.append(f"{column} = ${args}")
+        args += 1
+    if with_cursor:
+        # Keyset-пагинация: следующая страница начинается сразу после последней строки предыдущей
+        conditions.append(f"(created_at, id) < (${args}, ${args + 1})")
+        args += 2
+    return (
+        "SELECT id, user_id, user_username, name, message, created_at FROM support_requests "
+        f"WHERE {' AND '.join(conditions)} ORDER BY created_at DESC, id DESC LIMIT ${args}"
+    )
+
+
+_PAGE_QUERIES = {
+    (kind, with_cursor): _page_query(column, with_cursor)
+    for kind, column in FILTERS.items() for with_cursor in (False, True)
+}
+
+
+class _PageCache:
+    # Короткоживущий LRU-кэш готовых страниц и результатов поиска: повторные нажатия не обращаются к БД
+    def __init__(self, ttl: float = TICKET_PAGE_CACHE_TTL, max_size: int = 500):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: tuple) -> Any:
+        # Запись хранит момент, до которого она действительна
+        item = self._items.get(key)
+        if item is None or time.monotonic() >= item[0]:
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key: tuple, value: Any, ttl: Optional[float] = None) -> Any:
+        self._items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return value
+
+    def invalidate(self, key: tuple) -> None:
+        self._items.pop(key, None)
+
+
+page_cache = _PageCache()
+
+
+def _short(text: Optional[str], limit: int = 40) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else f"{text[:limit - 1]}…"
+
+
+async def render_page(kind: str, value: Optional[int], cursor: Cursor) -> Reply:
+    key = ("page", kind, value, cursor)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return cached
+
+    args = ([value] if FILTERS[kind] else []) + (list(cursor) if cursor else []) + [TICKET_PAGE_SIZE + 1]
+    async with get_connection() as conn:
+        rows = await conn.fetch(_PAGE_QUERIES[(kind, cursor is not None)], *args)
+    has_next = len(rows) > TICKET_PAGE_SIZE
+    rows = rows[:TICKET_PAGE_SIZE]
+
+    title = {"all": "📋 Последние заявки", "user": f"📋 Заявки пользователя {value}",
+             "admin": f"📋 Заявки администратора {value}"}[kind]
+    if not rows:
+        return page_cache.put(key, Reply(f"{title}\n\nЗаявок нет."))
+
+    lines = [title, ""]
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    for row in rows:
+        lines.append(f"#{row['id']} · {row['created_at']:%d.%m.%Y %H:%M} · {row['name'] or '—'} "
+                     f"(@{row['user_username'] or 'Не указан'})\n{_short(row['message'])}")
+        keyboard.insert(InlineKeyboardButton(f"🔎 #{row['id']} {_short(row['name'], 20)}",
+                                             callback_data=pack("view", row['id'])))
+    if has_next:
+        last = rows[-1]
+        keyboard.add(InlineKeyboardButton(
+            "Далее ▶️",
+            callback_data=pack("tpage", kind, value or 0, encode_cursor(last['created_at']), last['id'])
+        ))
+    return page_cache.put(key, Reply("\n".join(lines), freeze(keyboard)))
+
+
+async def render_ticket(request_id: int) -> Optional[Reply]:
+    key = ("ticket", request_id)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async with get_connection() as conn:
+        row = await conn.fetchrow(
+            "SELECT r.id, r.user_id, r.user_username, r.name, r.email, r.message, r.admin_id, r.admin_name, "
+            "r.document_id, r.photo_id, r.created_at, "
+            "(SELECT COUNT(*) FROM support_responses s WHERE s.request_id = r.id) AS responses "
+            "FROM support_requests r WHERE r.id = $1",
+            request_id
+        )
+    if row is None:
+        return None
+
+    lines = [
+        f"📄 Заявка #{row['id']} от {row['created_at']:%d.%m.%Y %H:%M}" if row['created_at']
+        else f"📄 Заявка #{row['id']}",
+        f"👤 Пользователь: {row['user_id'] or '—'}",
+        f"👤 Ссылка в tg: @{row['user_username'] or 'Не указан'}",
+        f"📛 Имя: {row['name'] or '—'}",
+        f"📧 Email: {row['email'] or '—'}",
+    ]
+    if row['admin_id']:
+        lines.append(f"🛠 Администратор: {row['admin_name'] or row['admin_id']}")
+    if row['document_id'] or row['photo_id']:
+        lines.append("📎 Есть вложение")
+    lines.append(f"💬 Ответов: {row['responses']}")
+    message = row['message'] or '—'
+    # Ограничение Telegram на длину сообщения - 4096 символов
+    lines.append(f"📝 Сообщение:\n{message if len(message) <= 3000 else message[:2999] + '…'}")
+
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    if row['user_id']:
+        keyboard.add(InlineKeyboardButton("✉️ Ответить", callback_data=pack("reply", row['id'])))
+        keyboard.add(InlineKeyboardButton("📋 Все заявки пользователя",
+                                          callback_data=pack("tpage", "user", row['user_id'], 0, 0)))
+    keyboard.add(InlineKeyboardButton("📋 Последние заявки", callback_data=pack("tpage", "all", 0, 0, 0)))
+    return page_cache.put(key, Reply("\n".join(lines), freeze(keyboard)))
+
+
+# Обработчики
+async def show_ticket(callback: types.CallbackQuery, state: FSMContext, request_id: int) -> None:
+    # Открывает заявку по кнопке view:<id>
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    reply = await render_ticket(request_id)
+    if reply is None:
+        await callback.answer(f"Заявка #{request_id} не найдена", show_alert=True)
+        return
+    await callback.message.answer(reply.text, reply_markup=reply.markup)
+    await callback.answer()
+
+
+async def page_callback(callback: types.CallbackQuery, state: FSMContext, kind: str, value: int,
+                        micros: int, last_id: int) -> None:
+    # Листает список заявок: tpage:<фильтр>:<значение>:<created_at>:<id>
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    try:
+        reply = await render_page(kind, value or None, decode_cursor(micros, last_id))
+    except KeyError:
+        logger.warning("Некорректные данные пагинации: %s", callback.data)
+        await callback.answer("Некорректный запрос")
+        return
+    # Первая страница открывается новым сообщением, следующие заменяют текущую
+    if micros == 0:
+        await callback.message.answer(reply.text, reply_markup=reply.markup)
+    elif callback.message.text != reply.text:
+        await callback.message.edit_text(reply.text, reply_markup=reply.markup)
+    await callback.answer()
+
+
+async def tickets_command(message: types.Message) -> None:
+    # /tickets, /tickets user <id>, /tickets admin <id>
+    args = message.get_args().split()
+    kind, value = "all", None
+    if args:
+        if len(args) != 2 or args[0] not in ("user", "admin") or not args[1].isdigit():
+            await message.answer("Использование: /tickets, /tickets user <id> или /tickets admin <id>")
+            return
+        kind, value = args[0], int(args[1])
+    reply = await render_page(kind, value, None)
+    await message.answer(reply.text, reply_markup=reply.markup)
+
+
+async def ticket_command(message: types.Message) -> None:
+    # /ticket <id>
+    request_id = message.get_args().strip().lstrip("#")
+    if not request_id.isdigit():
+        await message.answer("Использование: /ticket <номер заявки>")
+        return
+    reply = await render_ticket(int(request_id))
+    if reply is None:
+        await message.answer(f"Заявка #{request_id} не найдена")
+        return
+    await message.answer(reply.text, reply_markup=reply.markup)
@@ -0,0 +1,68 @@
+import json
+from typing import NamedTuple, Optional
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ParseMode
+from keyboards import inline
+from utils.callback_router import pack
+
+
+class Reply(NamedTuple):
+    # Готовый ответ: текст и уже сериализованная в JSON клавиатура.
+    # aiogram передает строку reply_markup в Bot API без повторной сериализации.
+    text: str
+    markup: Optional[str] = None
+    parse_mode: Optional[str] = None
+
+
+def freeze(markup: InlineKeyboardMarkup) -> str:
+    # Сериализует клавиатуру один раз
+    return json.dumps(markup.to_python(), ensure_ascii=False, separators=(",", ":"))
+
+
+# Клавиатуры, собираемые один раз при импорте
+START_MENU = freeze(inline.get_keyboard_start_menu())
+BACK_CANCEL = freeze(inline.get_back_cancel_keyboard())
+CANCEL = freeze(inline.cancel_keyboard_support())
+YES_NO = freeze(inline.get_yes_no_keyboard_support())
+CONSENT = freeze(InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("✅ Согласен", callback_data="consent_yes"),
+    InlineKeyboardButton("❌ Отмена", callback_data="cancel")
+))
+CANCEL_SKIP = freeze(InlineKeyboardMarkup(row_width=2).add(
+    InlineKeyboardButton("❌ Отмена", callback_data="cancel"),
+    InlineKeyboardButton("⏭ Пропустить", callback_data="skip_email")
+))
+
+# Шаблон клавиатуры "Ответить": JSON собран заранее, в обработчике подставляется только user_id
+_ID_MARK = "__id__"
+_ADMIN_REPLY_PREFIX, _ADMIN_REPLY_SUFFIX = freeze(InlineKeyboardMarkup(row_width=1).add(
+    InlineKeyboardButton("✉️ Ответить", callback_data=pack("reply_user", _ID_MARK))
+)).split(_ID_MARK)
+
+# Вариант для известного номера заявки: ответ привязывается к заявке, есть кнопка ее открытия
+_ADMIN_TICKET_PARTS = freeze(InlineKeyboardMarkup(row_width=1).add(
+    InlineKeyboardButton("✉️ Ответить", callback_data=pack("reply", _ID_MARK)),
+    InlineKeyboardButton("🔎 Открыть заявку", callback_data=pack("view", _ID_MARK))
+)).split(_ID_MARK)
+
+
+def admin_reply_markup(user_id: int, request_id: Optional[int] = None) -> str:
+    if request_id is None:
+        return f"{_ADMIN_REPLY_PREFIX}{int(user_id)}{_ADMIN_REPLY_SUFFIX}"
+    prefix, middle, suffix = _ADMIN_TICKET_PARTS
+    return f"{prefix}{int(request_id)}{middle}{int(request_id)}{suffix}"
+
+
+# Ответы диалога заявки
+WELCOME = Reply("\n\n👋 Привет! Я бот технической поддержки ЦХЭД.\n\n", START_MENU)
+CONSENT_REQUEST = Reply(
+    "Вы даете согласие на обработку персональных данных?\n\n"
+    "[Политика в отношении обработки и защиты персональных данных]"
+    "(https://platform-eadsc.voskhod.ru/docs_back/personal_data_processing_policy.pdf)",
+    CONSENT, ParseMode.MARKDOWN
+)
+ASK_NAME = Reply("Пожалуйста, введите ваше имя:", CANCEL)
+ASK_EMAIL = Reply("Введите ваш email:", BACK_CANCEL)
+ASK_PROBLEM = Reply("Опишите вашу проблему:", BACK_CANCEL)
+ASK_FILE = Reply("Хотите прикрепить файл к заявке?", YES_NO)
+EMAIL_CHECK_ERROR = Reply("Произошла ошибка при проверке email. Пожалуйста, попробуйте еще раз:", BACK_CANCEL)
+ASK_FORWARDED_EMAIL = Reply("Введите email пользователя (или нажмите 'Пропустить'):", CANCEL_SKIP)
@@ -1,62 +1,136 @@
 import logging
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.utils import executor
-from date.config import TELEGRAM_TOKEN
-from handlers import start, support, callback_admin
-from utils.database import create_tables
+from date.config import (
+    ADMIN_IDS, TELEGRAM_TOKEN, RUN_MODE, FSM_STORAGE, WORKER_PROCESSES,
+)
+from handlers import start, support, callback_admin, tickets, search
+from utils.database import close_pool
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from middlewares.thottling import ThrottlingMiddleware
-from utils.notify_admins import on_startup_notify, on_shutdown_notify
+from middlewares.inflight import inflight
+from middlewares.log_context import LogContextMiddleware
+from middlewares.fsm_flush import FSMFlushMiddleware
+from utils.fsm_storage import PostgresStorage
+from utils.notify_admins import on_shutdown_notify
 from states import user_state, admin_state
-from utils.set_bot_commands import set_default_commands
+from utils.webhook import start_webhook
+from utils.workers import Supervisor
+from utils.metrics import InstrumentedBot, FSM_SESSIONS
+from utils.app_context import AppContext
+from utils.logging_setup import setup_logging
+from utils.callback_router import CallbackRouter
 from aiogram import types
 
 
-# Настройка логгирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логгирования: JSON-записи пишет фоновый поток (utils/logging_setup.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 logger = logging.LoggerAdapter(logger, {"app": "тестовое приложение"})
 
 # Иницилизация бота
-bot =Bot(TELEGRAM_TOKEN)
-dp = Dispatcher(bot, storage=MemoryStorage())
+bot = InstrumentedBot(TELEGRAM_TOKEN)
+# Единственный экземпляр Bot процесса: им и его HTTP-сессией владеет контекст приложения
+app = AppContext(bot)
+storage = PostgresStorage() if FSM_STORAGE == "postgres" else MemoryStorage()
+dp = Dispatcher(bot, storage=storage)
+# Первым: записи остальных middleware и обработчиков получают update_id и chat_id
+dp.middleware.setup(LogContextMiddleware())
 dp.middleware.setup(LoggingMiddleware())
+if isinstance(storage, PostgresStorage):
+    dp.middleware.setup(FSMFlushMiddleware(storage))
+# Регистрируется после FSMFlushMiddleware: обновление считается завершенным только после записи FSM
+dp.middleware.setup(inflight)
+dp.middleware.setup(ThrottlingMiddleware())
+router = CallbackRouter()
+if isinstance(storage, PostgresStorage):
+    FSM_SESSIONS.set_function(lambda: storage.stats()[0], state="cached")
+    FSM_SESSIONS.set_function(lambda: storage.stats()[1], state="dirty")
 
 # Регистрация обработчиков
 dp.register_message_handler(start.start, commands=["start"])
+dp.register_message_handler(tickets.tickets_command, commands=["tickets"], user_id=ADMIN_IDS, state="*")
+dp.register_message_handler(tickets.ticket_command, commands=["ticket"], user_id=ADMIN_IDS, state="*")
+dp.register_message_handler(search.search_command, commands=["search"], user_id=ADMIN_IDS, state="*")
 dp.register_message_handler(support.get_name, state=user_state.SupportStates.GET_NAME)
 dp.register_message_handler(support.get_email, state=user_state.SupportStates.GET_EMAIL)
 dp.register_message_handler(support.get_message, state=user_state.SupportStates.GET_MESSAGE)
 dp.register_message_handler(callback_admin.handle_forwarded_message, is_forwarded=True, content_types=types.ContentType.ANY, state="*")  # Новый обработчик
-dp.register_callback_query_handler(support.cancel_handler, lambda c: c.data == "cancel", state="*")
-dp.register_callback_query_handler(support.back_handler, lambda c: c.data == "back", state="*")
 dp.register_message_handler(support.handle_admin_reply, state=admin_state.AdminStates.WAITING_FOR_REPLY)
-dp.register_callback_query_handler(callback_admin.skip_email,lambda c: c.data == "skip_email",state=user_state.SupportStates.GET_EMAIL_FORWARDED)
-dp.register_callback_query_handler(callback_admin.cancel_handler, lambda c: c.data == "cancel", state="*")
 dp.register_message_handler(callback_admin.get_forwarded_email,state=user_state.SupportStates.GET_EMAIL_FORWARDED)
-dp.register_callback_query_handler(support.start_support, lambda c: c.data == "start_support")
-dp.register_callback_query_handler(support.handle_admin_callback, lambda c: c.data.startswith("reply_") or c.data.startswith("view_"))
-dp.register_callback_query_handler(support.handle_consent, lambda c: c.data in ["consent_yes", "cancel"], state=user_state.SupportStates.GET_CONSENT)
-dp.register_callback_query_handler(support.handle_file_choice, state=user_state.SupportStates.GET_FILE)
 dp.register_message_handler(support.upload_file, state=user_state.SupportStates.GET_FILE_UPLOAD, content_types=['document', 'photo'])
-dp.register_callback_query_handler(support.handle_file_choice, lambda c: c.data in ["yes_support", "no_support"], state=user_state.SupportStates.GET_FILE)
+
+# Нажатия inline-кнопок: действие из callback_data ищется в словаре (utils/callback_router.py)
+router.register("cancel", support.cancel_handler, state="*")
+router.register("back", support.back_handler, state="*")
+router.register("start_support", support.start_support)
+router.register("consent_yes", support.handle_consent, state=user_state.SupportStates.GET_CONSENT)
+router.register("yes_support", support.handle_file_choice, state=user_state.SupportStates.GET_FILE)
+router.register("no_support", support.handle_file_choice, state=user_state.SupportStates.GET_FILE)
+router.register("skip_email", callback_admin.skip_email, state=user_state.SupportStates.GET_EMAIL_FORWARDED)
+router.register("reply", support.reply_to_ticket, payload=(int,))
+router.register("reply_user", support.reply_to_user, payload=(int,))
+router.register("view", tickets.show_ticket, payload=(int,), state="*")
+router.register("tpage", tickets.page_callback, payload=(str, int, int, int), state="*")
+router.register("search", search.page_callback, payload=(str, int), state="*")
+# Кнопки в сообщениях, отправленных до перехода на формат action:payload
+router.register("reply", support.reply_to_user, payload=(int,), legacy=True)
+router.register("view", tickets.show_ticket, payload=(int,), state="*", legacy=True)
+dp.register_callback_query_handler(router.handler, state="*")
+
+
+def get_dispatcher() -> Dispatcher:
+    # Используется процессами-обработчиками в режиме WORKER_PROCESSES > 1
+    return dp
+
+
+# Запуск служб процесса, который обрабатывает обновления
+async def start_services(dp):
+    await app.start(dp)
+
+
+# Остановка служб: сначала даем обрабатываемым обновлениям и очередям завершиться, затем закрываем соединения
+async def stop_services(dp):
+    await app.stop(dp)
+
+
+# Инициализация базы данных и бота (выполняется один раз, в том числе в режиме супервизора)
+async def prepare(dp):
+    await app.prepare(dp)
 
 
 # Уведомление об остановки бота
-async def on_shutdown(app):
+async def on_shutdown(dp):
     logger.info("Программа завершает работу")
     await on_shutdown_notify(dp)
+    await stop_services(dp)
 
 # Инициализация базы данных при запуске
 async def on_startup(dp):
     logger.info("Программа стартует")
-    await set_default_commands(dp)
-    await on_startup_notify(dp)
-    await create_tables()
+    await prepare(dp)
+    await start_services(dp)
+
+
+# Супервизору пул нужен только для подготовки БД
+async def on_supervisor_startup(dp):
+    logger.info("Программа стартует в режиме нескольких процессов")
+    await prepare(dp)
+    await close_pool()
+
+
+async def on_supervisor_shutdown(dp):
+    logger.info("Программа завершает работу")
+    await on_shutdown_notify(dp)
 
 
 # Запуск бота
 if __name__ == "__main__":
-    dp.middleware.setup(ThrottlingMiddleware())
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
\ No newline at end of file
+    if WORKER_PROCESSES > 1:
+        supervisor = Supervisor(WORKER_PROCESSES, get_dispatcher, start_services, stop_services)
+        supervisor.run(dp, on_startup=on_supervisor_startup, on_shutdown=on_supervisor_shutdown)
+    elif RUN_MODE == "webhook":
+        start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,17 @@
+import logging
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from utils.fsm_storage import PostgresStorage
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    # Сохраняет накопленные за обработку обновления изменения FSM одной записью в БД
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+        super(FSMFlushMiddleware, self).__init__()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        try:
+            await self.storage.flush()
+        except Exception as e:
+            logging.error("Ошибка сохранения состояния FSM: %s", e)
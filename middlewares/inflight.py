@@ -0,0 +1,42 @@
+import asyncio
+import time
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from utils.metrics import UPDATE_SECONDS, UPDATES_IN_FLIGHT
+
+
+class InFlightMiddleware(BaseMiddleware):
+    # Считает обновления, которые сейчас обрабатываются, чтобы при остановке дождаться их завершения
+    def __init__(self):
+        self.count = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        super(InFlightMiddleware, self).__init__()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        self.count += 1
+        self._idle.clear()
+        data["_inflight_started"] = time.perf_counter()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        self.count -= 1
+        started = data.get("_inflight_started")
+        if started is not None:
+            UPDATE_SECONDS.observe(time.perf_counter() - started)
+        if self.count <= 0:
+            self.count = 0
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        # Ждет завершения обрабатываемых обновлений не дольше timeout секунд
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+inflight = InFlightMiddleware()
+UPDATES_IN_FLIGHT.set_function(lambda: inflight.count)
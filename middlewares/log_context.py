@@ -0,0 +1,34 @@
+from typing import Optional
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from utils.logging_setup import update_id_var, chat_id_var
+
+
+def _chat_id(update: types.Update) -> Optional[int]:
+    # Чат обновления, а для обновлений без чата - пользователь
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message:
+            return message.chat.id
+    callback = update.callback_query
+    if callback:
+        return callback.message.chat.id if callback.message else callback.from_user.id
+    for event in (update.my_chat_member, update.chat_member, update.chat_join_request):
+        if event:
+            return event.chat.id
+    for event in (update.inline_query, update.chosen_inline_result, update.shipping_query,
+                  update.pre_checkout_query):
+        if event:
+            return event.from_user.id
+    return None
+
+
+class LogContextMiddleware(BaseMiddleware):
+    # Записи логов при обработке обновления получают его update_id и chat_id
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["_log_context"] = (update_id_var.set(update.update_id), chat_id_var.set(_chat_id(update)))
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        tokens = data.pop("_log_context", None)
+        if tokens is not None:
+            update_id_var.reset(tokens[0])
+            chat_id_var.reset(tokens[1])
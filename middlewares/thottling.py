@@ -1,39 +1,117 @@
 import asyncio
-from aiogram import types, Dispatcher
-from aiogram.dispatcher import DEFAULT_RATE_LIMIT, FSMContext
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Set, Tuple
+from aiogram import types
+from aiogram.dispatcher import DEFAULT_RATE_LIMIT
 from aiogram.dispatcher.handler import CancelHandler, current_handler
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram.utils.exceptions import Throttled
+
+
 class ThrottlingMiddleware(BaseMiddleware):
-    def __init__(self, limit=DEFAULT_RATE_LIMIT, key_prefix="antiflood_"):
+    # Скользящее окно на пользователя и обработчик: вызов чаще, чем раз в limit секунд, отклоняется.
+    # Состояние - O(1) на ключ, старые ключи вытесняются по LRU и TTL, без sleep в обработчиках.
+    def __init__(self, limit=DEFAULT_RATE_LIMIT, key_prefix="antiflood_", max_keys=10000, ttl=3600):
         self.rate_limit = limit
         self.prefix = key_prefix
+        self.max_keys = max_keys
+        self.ttl = ttl
+        # (user_id, key) -> (время последнего вызова, число превышений подряд)
+        self._calls: "OrderedDict[Tuple[int, str], Tuple[float, int]]" = OrderedDict()
+        self._unlock_timers: Dict[Tuple[int, str], asyncio.TimerHandle] = {}
+        # Задачи отправки уведомлений о разблокировке: ссылки держатся до завершения, при остановке - отмена
+        self._unlock_tasks: Set[asyncio.Task] = set()
         super(ThrottlingMiddleware, self).__init__()
-    async def on_process_message(self, message: types.Message, data: dict):
+
+    def _handler_limit(self, event=None) -> Tuple[float, str]:
         handler = current_handler.get()
-        dispatcher = Dispatcher.get_current()
         if handler:
             limit = getattr(handler, "throttling_rate_limit", self.rate_limit)
             key = getattr(handler, "throttling_key", f"{self.prefix}_{handler.__name__}")
+            # Общий обработчик нескольких действий (например, CallbackRouter) уточняет ключ по событию
+            suffix = getattr(handler, "throttling_suffix", None)
+            if suffix is not None and event is not None:
+                key = f"{key}:{suffix(event)}"
         else:
             limit = self.rate_limit
             key = f"{self.prefix}_message"
-        try:
-            await dispatcher.throttle(key, rate=limit)
-        except Throttled as t:
-            await self.message_throttled(message, t)
+        return limit, key
+
+    def _evict(self, now: float) -> None:
+        # Самые давние ключи в начале словаря: удаляем просроченные и лишние
+        while self._calls:
+            key, (last_call, _) = next(iter(self._calls.items()))
+            if len(self._calls) <= self.max_keys and now - last_call < self.ttl:
+                break
+            self._calls.popitem(last=False)
+
+    def hit(self, user_id: int, key: str, rate: float) -> Tuple[bool, int, float]:
+        # Регистрирует вызов; возвращает (пропущен ли, число превышений, сколько секунд до разблокировки)
+        now = time.monotonic()
+        last_call, exceeded = self._calls.pop((user_id, key), (None, 0))
+        allowed = last_call is None or now - last_call >= rate
+        exceeded = 1 if allowed else exceeded + 1
+        self._calls[(user_id, key)] = (now, exceeded)
+        self._evict(now)
+        return allowed, exceeded, rate
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        limit, key = self._handler_limit()
+        group_key = None
+        if message.media_group_id:
+            # Части альбома приходят почти одновременно: ограничивается только первая
+            group_key = (message.from_user.id, f"media_group:{message.media_group_id}")
+            if group_key in self._calls:
+                return
+        allowed, exceeded, delay = self.hit(message.from_user.id, key, limit)
+        if not allowed:
+            await self.message_throttled(message, key, exceeded, delay)
             raise CancelHandler()
-    async def message_throttled(self, message: types.Message, throttled: Throttled):
-        handler = current_handler.get()
-        dispatcher = Dispatcher.get_current()
-        if handler:
-            key = getattr(handler, "throttling_key", f"{self.prefix}_{handler.__name__}")
-        else:
-            key = f"{self.prefix}_message"
-        delta = throttled.rate - throttled.delta
-        if throttled.exceeded_count <=2:
+        if group_key is not None:
+            # Альбом отмечается только после пропуска первой части: иначе отклоненная первая часть
+            # пропустила бы остальные части альбома мимо антифлуда
+            self._calls[group_key] = (time.monotonic(), 0)
+
+    async def on_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        limit, key = self._handler_limit(callback)
+        allowed, exceeded, _ = self.hit(callback.from_user.id, key, limit)
+        if not allowed:
+            if exceeded <= 2:
+                await callback.answer("Слишком много запросов")
+            else:
+                await callback.answer()
+            raise CancelHandler()
+
+    async def message_throttled(self, message: types.Message, key: str, exceeded: int, delay: float):
+        if exceeded <= 2:
             await message.reply("Слишком много запросов")
-        await asyncio.sleep(delta)
-        thr = await dispatcher.check_key(key)
-        if thr.exceeded_count == throttled.exceeded_count:
-            await message.reply("Вы разблокированы")
\ No newline at end of file
+        # Переносим уведомление о разблокировке: оно уйдет, если за delay секунд не будет новых сообщений
+        timer_key = (message.from_user.id, key)
+        timer = self._unlock_timers.pop(timer_key, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._unlock_timers[timer_key] = loop.call_later(delay, self._start_notify, timer_key, message)
+
+    def _start_notify(self, timer_key: Tuple[int, str], message: types.Message):
+        task = asyncio.get_running_loop().create_task(self._notify_unlocked(timer_key, message))
+        self._unlock_tasks.add(task)
+        task.add_done_callback(self._unlock_tasks.discard)
+
+    async def _notify_unlocked(self, timer_key: Tuple[int, str], message: types.Message):
+        self._unlock_timers.pop(timer_key, None)
+        try:
+            await message.reply("Вы разблокированы")
+        except Exception as e:
+            logging.error("Не удалось отправить уведомление о разблокировке: %s", e)
+
+    async def close(self):
+        # Отменяет отложенные и отправляемые уведомления о разблокировке
+        for timer in self._unlock_timers.values():
+            timer.cancel()
+        self._unlock_timers.clear()
+        for task in self._unlock_tasks:
+            task.cancel()
+        if self._unlock_tasks:
+            await asyncio.gather(*self._unlock_tasks, return_exceptions=True)
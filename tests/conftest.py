@@ -0,0 +1,10 @@
+import os
+import sys
+
+# date/config.py читает обязательные переменные при импорте
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:ABCdef")
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("EMAIL_RECEIVER", "support@example.com")
+os.environ.setdefault("EMAIL_PORT", "587")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
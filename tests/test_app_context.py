@@ -0,0 +1,64 @@
+import asyncio
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from middlewares.inflight import inflight
+from utils.app_context import AppContext
+
+
+class FakeBot(Bot):
+    # getUpdates без сети: каждое обращение возвращает одно новое обновление
+    def __init__(self):
+        super().__init__("123456:ABCdef")
+        self.calls = 0
+
+    async def delete_webhook(self, *args, **kwargs):
+        return True
+
+    async def get_updates(self, offset=None, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        self.calls += 1
+        return [types.Update(**{
+            "update_id": self.calls,
+            "message": {
+                "message_id": self.calls, "date": 0, "text": "hello",
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "user"},
+            },
+        })]
+
+
+def test_stop_ends_polling_before_drain(monkeypatch):
+    async def scenario():
+        bot = FakeBot()
+        dp = Dispatcher(bot, storage=MemoryStorage())
+        dp.middleware.setup(inflight)
+        handled = []
+
+        async def handler(message: types.Message):
+            await asyncio.sleep(0.2)
+            handled.append(message.message_id)
+
+        dp.register_message_handler(handler)
+
+        calls_at_drain = []
+        drain = inflight.drain
+
+        async def tracked_drain(timeout):
+            calls_at_drain.append(bot.calls)
+            return await drain(timeout)
+
+        monkeypatch.setattr(inflight, "drain", tracked_drain)
+
+        polling = asyncio.create_task(dp.start_polling(timeout=0, relax=0))
+        while bot.calls < 5:
+            await asyncio.sleep(0.01)
+        await AppContext(bot, drain_timeout=5).stop(dp)
+        await asyncio.sleep(0.1)
+        polling.cancel()
+        return bot.calls, calls_at_drain, handled
+
+    calls, calls_at_drain, handled = asyncio.run(scenario())
+    # После начала ожидания обработчиков getUpdates больше не вызывается
+    assert calls_at_drain == [calls]
+    # И все полученные обновления обработаны до остановки
+    assert sorted(handled) == list(range(1, calls + 1))
@@ -0,0 +1,40 @@
+import asyncio
+import contextlib
+from utils import fsm_storage
+from utils.fsm_storage import PostgresStorage
+
+
+class FakeConnection:
+    # В таблице нет строк: каждое чтение возвращает пустой результат
+    async def fetchrow(self, query, *args):
+        return None
+
+
+def test_get_data_returns_default_for_missing_record(monkeypatch):
+    conn = FakeConnection()
+
+    @contextlib.asynccontextmanager
+    async def get_connection():
+        yield conn
+
+    monkeypatch.setattr(fsm_storage, "get_connection", get_connection)
+
+    async def scenario():
+        storage = PostgresStorage()
+        default = {"step": 1, "files": []}
+        data = await storage.get_data(chat=1, user=1, default=default)
+        # Возвращается копия: изменение результата не меняет переданный default
+        data["files"].append("a")
+        bucket = await storage.get_bucket(chat=1, user=1, default={"hits": 0})
+        empty = await storage.get_data(chat=1, user=1)
+        await storage.set_data(chat=1, user=1, data={"step": 2})
+        stored = await storage.get_data(chat=1, user=1, default=default)
+        return default, data, bucket, empty, stored
+
+    default, data, bucket, empty, stored = asyncio.run(scenario())
+    assert data == {"step": 1, "files": ["a"]}
+    assert default == {"step": 1, "files": []}
+    assert bucket == {"hits": 0}
+    assert empty == {}
+    # Сохраненные данные важнее default
+    assert stored == {"step": 2}
@@ -0,0 +1,38 @@
+import asyncio
+from aiogram import Bot
+from handlers import support
+
+
+class FakeBot(Bot):
+    # Запоминает отправленные сообщения и альбомы вместо обращения к Bot API
+    def __init__(self):
+        super().__init__("123456:ABCdef")
+        self.messages = []
+        self.albums = []
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        self.messages.append(chat_id)
+
+    async def send_media_group(self, chat_id, media, *args, **kwargs):
+        self.albums.append((chat_id, [item.media for item in media]))
+
+
+def test_notify_admins_sends_album_to_each_admin():
+    files = [
+        {"path": "a.jpg", "file_id": "photo-1", "file_type": "photo"},
+        {"path": "b.jpg", "file_id": "photo-2", "file_type": "photo"},
+    ]
+
+    async def scenario():
+        bot = FakeBot()
+        failed = await support.notify_admins(
+            bot, {"name": "Иван", "email": "user@example.com"}, 42, "user", "Не работает вход",
+            document_path="a.jpg", admin_ids=[1, 2], file_id="photo-1", file_type="photo",
+            request_id=7, files=files,
+        )
+        return bot, failed
+
+    bot, failed = asyncio.run(scenario())
+    assert failed == []
+    assert sorted(bot.messages) == [1, 2]
+    assert sorted(bot.albums) == [(1, ["photo-1", "photo-2"]), (2, ["photo-1", "photo-2"])]
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+import asyncpg
+from aiogram import Bot, Dispatcher
+from date.config import RUN_MODE, SHUTDOWN_DRAIN_TIMEOUT, METRICS_HOST, METRICS_PORT, METRICS_PATH
+from middlewares.inflight import inflight
+from middlewares.thottling import ThrottlingMiddleware
+from utils import workers
+from utils.attachments import attachment_store
+from utils.database import create_pool, create_tables, close_pool
+from utils.downloader import file_downloader
+from utils.email_digest import email_digest
+from utils.email_sender import email_sender
+from utils.fsm_storage import PostgresStorage
+from utils.media_cache import media_cache
+from utils.metrics import metrics_server
+from utils.notify_admins import on_startup_notify
+from utils.outbox import outbox_dispatcher
+from utils.set_bot_commands import set_default_commands
+from utils.ticket_batcher import ticket_batcher
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд дается на закрытие соединений, даже если срок остановки уже истек
+CLOSE_TIMEOUT = 5
+
+
+class AppContext:
+    """
+    Ресурсы процесса бота: Bot с его HTTP-сессией, пул БД и фоновые службы.
+
+    Независимые шаги запуска выполняются параллельно. При остановке контекст
+    прекращает long polling и за SHUTDOWN_DRAIN_TIMEOUT секунд дожидается
+    обрабатываемых обновлений, сбрасывает очереди (пакеты заявок, дайджест,
+    outbox, email) и только затем закрывает соединения.
+    """
+
+    def __init__(self, bot: Bot, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        self.bot = bot
+        self.drain_timeout = drain_timeout
+        self.pool: Optional[asyncpg.Pool] = None
+
+    async def _open_database(self, migrate: bool = False) -> None:
+        self.pool = await create_pool()
+        if migrate:
+            await create_tables()
+            # Кэш file_id хранится в БД, поэтому прогревается после миграций
+            await media_cache.warm(self.bot)
+
+    async def prepare(self, dp: Dispatcher) -> None:
+        # Подготовка БД и бота (выполняется один раз, в том числе в режиме супервизора)
+        await asyncio.gather(
+            self._open_database(migrate=True),
+            set_default_commands(dp),
+            on_startup_notify(dp),
+        )
+
+    async def _start_metrics(self) -> None:
+        # В режиме webhook метрики отдает сервер webhook
+        worker = workers.current_worker
+        if not METRICS_PORT or (worker is None and RUN_MODE == "webhook"):
+            return
+        port = METRICS_PORT if worker is None else METRICS_PORT + worker + 1
+        try:
+            await metrics_server.start(METRICS_HOST, port, METRICS_PATH)
+        except OSError as e:
+            logger.error("Не удалось запустить сервер метрик на порту %s: %s", port, e)
+
+    async def start(self, dp: Dispatcher) -> None:
+        # Запуск служб процесса, который обрабатывает обновления
+        await asyncio.gather(self._start_metrics(), self._open_database(), email_sender.start())
+        outbox_dispatcher.start(self.bot)
+        attachment_store.start_janitor()
+        if isinstance(dp.storage, PostgresStorage):
+            dp.storage.start_cleanup()
+
+    async def stop(self, dp: Dispatcher) -> None:
+        # Остановка в пределах drain_timeout: обновления и очереди, затем соединения
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+
+        def remaining() -> float:
+            return max(deadline - loop.time(), 0)
+
+        # Новые обновления не принимаются: long polling останавливается до ожидания обработчиков,
+        # иначе он продолжал бы подтверждать offset и занимать время остановки новыми обновлениями
+        await self._stop_polling(dp, remaining)
+        if not await inflight.drain(remaining()):
+            logger.warning("Не завершились обработчики обновлений: %s", inflight.count)
+        # Очереди сбрасываются по порядку: заявки пишут в outbox, дайджест и outbox - в очередь email;
+        # очистка вложений и FSM пишут в БД, поэтому завершаются до закрытия пула
+        for name, step in (
+            ("пакеты заявок", ticket_batcher.stop),
+            ("дайджест email", email_digest.stop),
+            ("outbox", outbox_dispatcher.stop),
+            ("очередь email", lambda: email_sender.stop(remaining())),
+            ("очистка вложений", attachment_store.stop_janitor),
+            ("хранилище FSM", dp.storage.close),
+        ):
+            await self._run_step(name, step, remaining())
+
+        # Отложенные уведомления антифлуда используют сессию Bot API и отменяются до ее закрытия
+        for middleware in dp.middleware.applications:
+            if isinstance(middleware, ThrottlingMiddleware):
+                await self._run_step("антифлуд", middleware.close, CLOSE_TIMEOUT)
+
+        # Соединения независимы друг от друга и закрываются параллельно
+        await asyncio.gather(
+            self._run_step("загрузчик файлов", file_downloader.close, CLOSE_TIMEOUT),
+            self._run_step("сервер метрик", metrics_server.stop, CLOSE_TIMEOUT),
+            self._run_step("пул БД", close_pool, CLOSE_TIMEOUT),
+            self._run_step("сессия Bot API", self._close_bot_session, CLOSE_TIMEOUT),
+        )
+        self.pool = None
+
+    @staticmethod
+    async def _stop_polling(dp: Dispatcher, remaining: Callable[[], float]) -> None:
+        # В режиме webhook и в процессах-обработчиках polling не запущен
+        if not dp.is_polling():
+            return
+        dp.stop_polling()
+        try:
+            # Текущий getUpdates завершается не позже своего таймаута
+            await asyncio.wait_for(dp.wait_closed(), remaining())
+        except asyncio.TimeoutError:
+            logger.warning("Long polling не остановился за отведенное время")
+            return
+        # Последняя полученная пачка обновлений уже передана в задачу - дожидаемся ее обработки
+        pending = [task for task in asyncio.all_tasks()
+                   if getattr(task.get_coro(), "__qualname__", "") == "Dispatcher._process_polling_updates"]
+        if pending:
+            await asyncio.wait(pending, timeout=max(remaining(), 0.1))
+
+    async def _close_bot_session(self) -> None:
+        session = await self.bot.get_session()
+        await session.close()
+
+    @staticmethod
+    async def _run_step(name: str, step: Callable[[], Awaitable[None]], timeout: float) -> None:
+        # Ошибка или зависание одного шага не должны мешать остальным
+        try:
+            await asyncio.wait_for(step(), max(timeout, CLOSE_TIMEOUT))
+        except asyncio.TimeoutError:
+            logger.warning("Остановка прервана по таймауту: %s", name)
+        except Exception as e:
+            logger.error("Ошибка остановки (%s): %s", name, e)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from typing import Iterable, List, NamedTuple, Optional
+from date.config import (
+    ATTACHMENTS_DIR, ATTACHMENT_RETENTION, ATTACHMENT_ORPHAN_TTL, ATTACHMENTS_MAX_BYTES,
+    ATTACHMENT_JANITOR_INTERVAL, TEMP_DIR,
+)
+from utils.database import get_connection
+from utils.downloader import DownloadResult, sanitize_filename
+from utils.metrics import ATTACHMENTS
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock: очистку хранилища одновременно выполняет только один процесс
+JANITOR_LOCK_KEY = 0x7453_6A61
+# Пространство advisory lock отдельных файлов (второй ключ - hashtext(sha256)): запись файла в хранилище
+# и его удаление очисткой не выполняются одновременно
+BLOB_LOCK_SPACE = 0x7453_6162
+# Файлы, использованные за этот период, не вытесняются по квоте: заявка с ними может еще оформляться
+_IN_USE_GUARD = 3600
+
+_PUT_QUERY = """
+    INSERT INTO attachments (sha256, path, size) VALUES ($1, $2, $3)
+    ON CONFLICT (sha256) DO UPDATE SET last_used_at = NOW()
+    RETURNING path
+"""
+# Связь заявки с файлом; счетчик ссылок увеличивается, только если связи еще не было
+_LINK_QUERY = """
+    WITH linked AS (
+        INSERT INTO ticket_attachments (request_id, sha256) VALUES ($1, $2)
+        ON CONFLICT DO NOTHING RETURNING sha256
+    )
+    UPDATE attachments SET refcount = refcount + 1, last_used_at = NOW()
+    WHERE sha256 IN (SELECT sha256 FROM linked)
+"""
+_BLOB_LOCK_QUERY = "SELECT pg_advisory_xact_lock($1, hashtext($2))"
+# Файлы, которые сейчас не записываются в хранилище; блокировки держатся до конца транзакции очистки
+_TRY_BLOB_LOCKS_QUERY = """
+    SELECT sha256 FROM unnest($2::text[]) sha256 WHERE pg_try_advisory_xact_lock($1, hashtext(sha256))
+"""
+_EXPIRED_QUERY = """
+    SELECT sha256, path, size FROM attachments
+    WHERE (refcount <= 0 AND last_used_at < NOW() - make_interval(secs => $1))
+       OR last_used_at < NOW() - make_interval(secs => $2)
+    FOR UPDATE SKIP LOCKED
+"""
+# Самые давно использованные файлы, без которых объем хранилища укладывается в квоту
+_OVER_QUOTA_QUERY = """
+    SELECT sha256, path, size FROM (
+        SELECT sha256, path, size, last_used_at,
+               SUM(size) OVER (ORDER BY last_used_at DESC, sha256) AS kept
+        FROM attachments
+    ) files
+    WHERE kept > $1 AND last_used_at < NOW() - make_interval(secs => $2) AND NOT (sha256 = ANY($3))
+"""
+# Удаленные файлы больше не доступны по путям заявок (вложение остается в Telegram по file_id)
+_DETACH_QUERY = """
+    UPDATE support_requests r SET
+        document_path = CASE WHEN r.document_path = ANY($2) THEN NULL ELSE r.document_path END,
+        photo_path = CASE WHEN r.photo_path = ANY($2) THEN NULL ELSE r.photo_path END
+    FROM ticket_attachments t
+    WHERE t.request_id = r.id AND t.sha256 = ANY($1)
+"""
+
+
+class StoredAttachment(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def _place(source: str, target: str) -> bool:
+    # Переносит скачанный файл в хранилище; возвращает False, если такой файл там уже есть
+    if os.path.exists(target):
+        os.remove(source)
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(source, target)
+    return True
+
+
+def _remove_files(paths: Iterable[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        # Каталог файла назван по хешу и после удаления файла не нужен
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+
+def _remove_stale_parts(directory: str, max_age: float) -> int:
+    # Недокачанные файлы (.part), оставшиеся после аварийной остановки
+    removed = 0
+    deadline = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(".part") and entry.stat().st_mtime < deadline:
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+
+class AttachmentStore:
+    """
+    Хранилище вложений заявок с адресацией по содержимому.
+
+    Файл хранится в каталоге <первые 2 символа SHA-256>/<SHA-256> под исходным
+    именем, поэтому одинаковые файлы от разных пользователей занимают место
+    один раз. Таблица attachments ведет счетчик заявок, ссылающихся на файл
+    (ticket_attachments). Фоновая очистка удаляет файлы старше срока
+    хранения, файлы без заявок и, при превышении квоты, самые давно
+    использованные файлы.
+    """
+
+    def __init__(self, directory: str = ATTACHMENTS_DIR, retention: float = ATTACHMENT_RETENTION,
+                 orphan_ttl: float = ATTACHMENT_ORPHAN_TTL, max_bytes: int = ATTACHMENTS_MAX_BYTES,
+                 interval: float = ATTACHMENT_JANITOR_INTERVAL):
+        self.directory = directory
+        self.retention = retention
+        self.orphan_ttl = orphan_ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._janitor: Optional[asyncio.Task] = None
+
+    def blob_path(self, sha256: str, name: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256, sanitize_filename(name))
+
+    async def put(self, downloaded: DownloadResult, name: Optional[str] = None) -> StoredAttachment:
+        # Переносит скачанный файл в хранилище; для уже известного содержимого возвращает имеющийся путь
+        loop = asyncio.get_running_loop()
+        target = self.blob_path(downloaded.sha256, name or os.path.basename(downloaded.path))
+        try:
+            async with get_connection() as conn:
+                async with conn.transaction():
+                    # Пока файл переносится, очистка не удалит ни его запись, ни файл с тем же хешем
+                    await conn.execute(_BLOB_LOCK_QUERY, BLOB_LOCK_SPACE, downloaded.sha256)
+                    path = await conn.fetchval(_PUT_QUERY, downloaded.sha256, target, downloaded.size)
+                    stored = await loop.run_in_executor(None, _place, downloaded.path, path)
+        except BaseException:
+            await loop.run_in_executor(None, _remove_files, [downloaded.path])
+            raise
+        ATTACHMENTS.inc(result="stored" if stored else "deduplicated")
+        if not stored:
+            logger.info("Файл %s уже есть в хранилище: %s", downloaded.sha256, path)
+        return StoredAttachment(path, downloaded.sha256, downloaded.size)
+
+    @staticmethod
+    async def link(conn, request_id: int, hashes: Iterable[str]) -> None:
+        # Связывает файлы с заявкой в транзакции, которая ее создает
+        await conn.executemany(_LINK_QUERY, [(request_id, sha256) for sha256 in hashes])
+
+    async def collect(self) -> int:
+        # Один проход очистки; возвращает число удаленных файлов
+        loop = asyncio.get_running_loop()
+        async with get_connection() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", JANITOR_LOCK_KEY):
+                return 0
+            try:
+                async with conn.transaction():
+                    rows = await conn.fetch(_EXPIRED_QUERY, self.orphan_ttl, self.retention)
+                    if self.max_bytes:
+                        rows += await conn.fetch(_OVER_QUOTA_QUERY, self.max_bytes, _IN_USE_GUARD,
+                                                 [row["sha256"] for row in rows])
+                    if rows:
+                        # Файлы, которые сейчас записывает put(), пропускаются до следующего прохода;
+                        # остальные put() не тронет, пока файлы не удалены и транзакция не завершена
+                        locked = {
+                            row["sha256"] for row in await conn.fetch(
+                                _TRY_BLOB_LOCKS_QUERY, BLOB_LOCK_SPACE, [row["sha256"] for row in rows]
+                            )
+                        }
+                        rows = [row for row in rows if row["sha256"] in locked]
+                    if rows:
+                        hashes = [row["sha256"] for row in rows]
+                        await conn.execute(_DETACH_QUERY, hashes, [row["path"] for row in rows])
+                        await conn.execute("DELETE FROM attachments WHERE sha256 = ANY($1)", hashes)
+                        await loop.run_in_executor(None, _remove_files, [row["path"] for row in rows])
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", JANITOR_LOCK_KEY)
+        removed: List[str] = [row["path"] for row in rows]
+        parts = await loop.run_in_executor(None, _remove_stale_parts, TEMP_DIR, self.orphan_ttl)
+        if removed or parts:
+            freed = sum(row["size"] for row in rows)
+            logger.info("Очистка вложений: удалено файлов %s (%s байт), недокачанных файлов %s",
+                        len(removed), freed, parts)
+        return len(removed)
+
+    def start_janitor(self) -> None:
+        if self._janitor is None:
+            self._janitor = asyncio.create_task(self._janitor_loop(), name="attachments-janitor")
+
+    async def _janitor_loop(self) -> None:
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error("Ошибка очистки хранилища вложений: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def stop_janitor(self) -> None:
+        if self._janitor is not None:
+            task, self._janitor = self._janitor, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+# Общее хранилище вложений (очистка запускается в start_services)
+attachment_store = AttachmentStore()
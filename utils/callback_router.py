@@ -0,0 +1,120 @@
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, NamedTuple, Optional, Sequence, Tuple
+from aiogram import types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters.state import State
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA = 64
+
+_INT = re.compile(r"-?\d+")
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+def pack(action: str, *payload: Any) -> str:
+    # callback_data вида action:part1:part2
+    data = SEPARATOR.join((action, *map(str, payload)))
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data}")
+    return data
+
+
+def _convert(kind: type, part: str) -> Any:
+    # int() принимает "1_2" и пробелы, поэтому числа проверяются строго
+    if kind is int and not _INT.fullmatch(part):
+        raise ValueError(f"не число: {part}")
+    return kind(part)
+
+
+class Route(NamedTuple):
+    handler: Handler
+    # Типы частей payload; значения передаются обработчику позиционными аргументами после state
+    payload: Tuple[type, ...]
+    # Допустимые состояния FSM (None - без состояния); states=None - любое состояние
+    states: Optional[FrozenSet[Optional[str]]]
+
+
+class CallbackRouter:
+    """
+    Маршрутизация нажатий inline-кнопок по словарю.
+
+    callback_data имеет вид action или action:payload; действие ищется
+    в словаре за одну операцию, payload приводится к объявленным типам.
+    Поддерживаются и прежние кнопки вида prefix_payload из уже
+    отправленных сообщений (legacy=True при регистрации).
+    Стоимость разбора не зависит от числа зарегистрированных действий.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Route] = {}
+        self._legacy: Dict[str, Route] = {}
+
+        async def handler(callback: types.CallbackQuery, state: FSMContext) -> Any:
+            return await self.dispatch(callback, state)
+
+        # Обработчик для dp.register_callback_query_handler; антифлуд считает каждое действие отдельно
+        handler.throttling_suffix = self.action_of
+        self.handler = handler
+
+    def register(self, action: str, handler: Handler, *, payload: Sequence[type] = (),
+                 state: Any = None, legacy: bool = False) -> None:
+        # state как у aiogram: None - только без состояния, "*" - любое, State или список состояний
+        route = Route(handler, tuple(payload), self._states(state))
+        table = self._legacy if legacy else self._routes
+        if action in table:
+            raise ValueError(f"Действие {action} уже зарегистрировано")
+        table[action] = route
+
+    @staticmethod
+    def _states(state: Any) -> Optional[FrozenSet[Optional[str]]]:
+        if state == "*":
+            return None
+        if not isinstance(state, (list, tuple, set, frozenset)):
+            state = [state]
+        return frozenset(item.state if isinstance(item, State) else item for item in state)
+
+    def resolve(self, data: Optional[str]) -> Tuple[Optional[str], Optional[Route], Sequence[str]]:
+        # (действие, маршрут, части payload) для callback_data
+        if not data:
+            return None, None, ()
+        route = self._routes.get(data)
+        if route is not None:
+            return data, route, ()
+        action, separator, rest = data.partition(SEPARATOR)
+        if separator:
+            return action, self._routes.get(action), rest.split(SEPARATOR)
+        # Кнопки старого формата: prefix_part1_part2; последняя часть может содержать "_"
+        action, separator, rest = data.partition("_")
+        route = self._legacy.get(action) if separator else None
+        if route is None:
+            return data, None, ()
+        return action, route, rest.split("_", max(len(route.payload) - 1, 0))
+
+    def action_of(self, callback: types.CallbackQuery) -> str:
+        # Ключ антифлуда: каждое действие ограничивается отдельно
+        return self.resolve(callback.data)[0] or "unknown"
+
+    async def dispatch(self, callback: types.CallbackQuery, state: FSMContext) -> Any:
+        action, route, parts = self.resolve(callback.data)
+        if route is None:
+            logger.warning("Неизвестная кнопка: %s", callback.data)
+            await callback.answer()
+            return None
+        if route.states is not None and await state.get_state() not in route.states:
+            # Кнопка из устаревшего сообщения: в текущем состоянии действие недоступно
+            await callback.answer("Действие недоступно в текущем состоянии")
+            return None
+        try:
+            if len(parts) != len(route.payload):
+                raise ValueError(f"ожидается частей: {len(route.payload)}")
+            payload = [_convert(kind, part) for kind, part in zip(route.payload, parts)]
+        except ValueError as e:
+            logger.warning("Некорректные данные кнопки %s: %s", callback.data, e)
+            await callback.answer("Некорректный запрос")
+            return None
+        return await route.handler(callback, state, *payload)
@@ -1,53 +1,94 @@
 import asyncpg
-from date.config import POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB
+import logging
+import time
+from typing import Optional
+from date.config import (
+    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB,
+    POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE, POSTGRES_STATEMENT_CACHE_SIZE,
+    POSTGRES_POOL_ACQUIRE_TIMEOUT,
+)
 from contextlib import asynccontextmanager
+from utils.migrations import migrate
+from utils.metrics import DB_SECONDS, DB_POOL
+
+logger = logging.getLogger(__name__)
+
+# Общий пул соединений приложения (создается в on_startup, закрывается в on_shutdown)
+_pool: Optional[asyncpg.Pool] = None
+
+
+# Создает пул соединений при старте приложения
+async def create_pool() -> asyncpg.Pool:
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD,
+            database=POSTGRES_DB,
+            min_size=POSTGRES_POOL_MIN_SIZE,
+            max_size=POSTGRES_POOL_MAX_SIZE,
+            statement_cache_size=POSTGRES_STATEMENT_CACHE_SIZE,
+        )
+        logger.info(
+            "Пул соединений с БД создан (min=%s, max=%s)", POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE
+        )
+    return _pool
+
+
+# Закрывает пул соединений при остановке приложения
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+        logger.info("Пул соединений с БД закрыт")
+
+
+def get_pool() -> asyncpg.Pool:
+    # Возвращает пул, созданный в on_startup
+    if _pool is None:
+        raise RuntimeError("Пул соединений не инициализирован: вызовите create_pool() в on_startup")
+    return _pool
+
+
+# Статистика загрузки пула
+def get_pool_stats() -> dict:
+    if _pool is None:
+        return {"size": 0, "idle": 0, "in_use": 0, "min_size": POSTGRES_POOL_MIN_SIZE,
+                "max_size": POSTGRES_POOL_MAX_SIZE, "saturation": 0.0}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    max_size = _pool.get_max_size()
+    return {
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": _pool.get_min_size(),
+        "max_size": max_size,
+        "saturation": (size - idle) / max_size if max_size else 0.0,
+    }
+
+
+DB_POOL.set_function(lambda: get_pool_stats()["idle"], state="idle")
+DB_POOL.set_function(lambda: get_pool_stats()["in_use"], state="in_use")
 
-#Создает подключение к базе данных
-async def create_connection():
-    return await asyncpg.connect(
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD,
-        database=POSTGRES_DB,
-    )
 
 # Добавляем контекстный менеджер для соединения с БД
 @asynccontextmanager
 async def get_connection():
-    # Контекстный менеджер для работы с БД
-    conn = await create_connection()
-    try:
-        yield conn
-    finally:
-        await conn.close()
-
-#Создает таблицы в базе данных, если они не существуют
+    # Берет соединение из общего пула и возвращает его после использования
+    started = time.perf_counter()
+    async with get_pool().acquire(timeout=POSTGRES_POOL_ACQUIRE_TIMEOUT) as conn:
+        acquired = time.perf_counter()
+        DB_SECONDS.observe(acquired - started, phase="acquire")
+        try:
+            yield conn
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - acquired, phase="hold")
+
+# Приводит схему БД к актуальной версии (см. utils/migrations.py)
 async def create_tables():
     async with get_connection() as conn:
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS support_requests (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NULL,
-                user_username TEXT NULL,
-                name TEXT NULL,
-                email TEXT NULL,
-                message TEXT NULL,
-                admin_id BIGINT NULL,
-                admin_name TEXT NULL,
-                document_id TEXT,
-                photo_id TEXT,
-                document_path TEXT,
-                photo_path TEXT,
-                created_at TIMESTAMP DEFAULT NOW()
-            );
-        """)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS support_responses (
-                id SERIAL PRIMARY KEY,
-                request_id INT REFERENCES support_requests(id),
-                admin_id BIGINT NOT NULL,
-                message TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT NOW()
-            );
-        """)
\ No newline at end of file
+        await migrate(conn)
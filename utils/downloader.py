@@ -0,0 +1,159 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import os
+import re
+from typing import List, NamedTuple, Optional, Sequence, Set, Tuple
+import aiohttp
+from aiogram import Bot
+from date.config import TEMP_DIR, MAX_DOWNLOAD_SIZE, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT, DOWNLOAD_CONCURRENCY
+from utils.metrics import DOWNLOADED_BYTES, timed
+
+logger = logging.getLogger(__name__)
+
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+
+class FileTooLarge(Exception):
+    """Размер файла превышает MAX_DOWNLOAD_SIZE."""
+
+
+class DownloadResult(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+
+
+def sanitize_filename(filename: str) -> str:
+    # Очищает имя файла от недопустимых символов
+    return re.sub(r'[\\/*?:"<>|]', "_", filename)
+
+
+def build_file_name(file_id: str, file_type: str, original_name: Optional[str], telegram_path: str) -> str:
+    # Формирует локальное имя файла с временной меткой
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    if file_type == "document" and original_name:
+        return f"{timestamp}_{sanitize_filename(original_name)}"
+    if file_type == "photo":
+        return f"{timestamp}_{sanitize_filename(original_name or f'photo_{file_id[:8]}')}.jpg"
+    ext = os.path.splitext(telegram_path)[1] if '.' in telegram_path else ''
+    return f"{file_type}_{timestamp}_{file_id[:8]}{ext}"
+
+
+class FileDownloader:
+    """
+    Сервис скачивания файлов из Telegram.
+
+    Использует одну keep-alive сессию aiohttp на все загрузки, пишет файл
+    на диск частями (запись вынесена из event loop), прерывает загрузку при
+    превышении max_size и считает SHA-256 по ходу скачивания. Одновременно
+    выполняется не больше concurrency загрузок, остальные ждут очереди.
+    """
+
+    def __init__(self, max_size: int = MAX_DOWNLOAD_SIZE, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                 directory: str = TEMP_DIR, concurrency: int = DOWNLOAD_CONCURRENCY):
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        # Пути файлов, которые сейчас скачиваются (части альбома могут получить одинаковые имена)
+        self._active: Set[str] = set()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @timed("download_file")
+    async def download(self, bot: Bot, file_id: str, file_type: str,
+                       original_name: Optional[str] = None) -> DownloadResult:
+        # Скачивает файл Telegram в каталог временных файлов
+        async with self._slots:
+            file = await bot.get_file(file_id)
+            if file.file_size and file.file_size > self.max_size:
+                raise FileTooLarge(f"Файл {file.file_size} байт превышает лимит {self.max_size} байт")
+            file_path = self._reserve(build_file_name(file_id, file_type, original_name, file.file_path))
+            try:
+                return await self.fetch(bot.get_file_url(file.file_path), file_path)
+            finally:
+                self._active.discard(file_path)
+
+    def _reserve(self, file_name: str) -> str:
+        # Свободный путь в каталоге загрузок: при совпадении имени добавляется номер
+        base, ext = os.path.splitext(os.path.join(self.directory, file_name))
+        file_path, index = base + ext, 1
+        while file_path in self._active or os.path.exists(file_path):
+            file_path = f"{base}_{index}{ext}"
+            index += 1
+        self._active.add(file_path)
+        return file_path
+
+    async def fetch(self, url: str, file_path: str) -> DownloadResult:
+        # Потоково сохраняет содержимое url в file_path
+        loop = asyncio.get_running_loop()
+        part_path = f"{file_path}.part"
+        digest = hashlib.sha256()
+        size = 0
+        async with self._get_session().get(url) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status,
+                    message=f"Ошибка загрузки файла, статус: {response.status}"
+                )
+            if response.content_length and response.content_length > self.max_size:
+                raise FileTooLarge(f"Файл {response.content_length} байт превышает лимит {self.max_size} байт")
+            f = await loop.run_in_executor(None, open, part_path, 'wb')
+            try:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise FileTooLarge(f"Файл превышает лимит {self.max_size} байт")
+                    digest.update(chunk)
+                    await loop.run_in_executor(None, f.write, chunk)
+            except BaseException:
+                await loop.run_in_executor(None, f.close)
+                await loop.run_in_executor(None, _remove_quietly, part_path)
+                raise
+            await loop.run_in_executor(None, f.close)
+        await loop.run_in_executor(None, os.replace, part_path, file_path)
+        DOWNLOADED_BYTES.inc(size)
+        logger.info("Файл сохранен: %s (%s байт)", file_path, size)
+        return DownloadResult(file_path, size, digest.hexdigest())
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Общий сервис скачивания (сессия закрывается в on_shutdown)
+file_downloader = FileDownloader()
+
+
+async def download_file(bot: Bot, file_id: str, file_type: str,
+                        original_name: Optional[str] = None) -> Optional[DownloadResult]:
+    # Скачивает файл из Telegram; при ошибке пишет в лог и возвращает None
+    try:
+        return await file_downloader.download(bot, file_id, file_type, original_name)
+    except FileTooLarge as e:
+        logger.warning("Файл %s не скачан: %s", file_id, e)
+    except Exception as e:
+        logger.error("Ошибка при скачивании файла: %s", e)
+    return None
+
+
+async def download_files(bot: Bot, files: Sequence[Tuple[str, str, Optional[str]]]) -> List[Optional[DownloadResult]]:
+    # Параллельно скачивает файлы (file_id, тип, исходное имя); порядок результатов совпадает с files
+    return list(await asyncio.gather(*(download_file(bot, *file) for file in files)))
@@ -0,0 +1,127 @@
+import asyncio
+import html
+import logging
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from date.config import EMAIL_DIGEST, EMAIL_DIGEST_WINDOW, EMAIL_DIGEST_MAX
+from utils.email_sender import send_email_async
+from utils.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SUBJECT = "Заявки в техническую поддержку через чат"
+
+
+class _Entry(NamedTuple):
+    subject: str
+    body: str
+    attachments: List[str]
+    future: Optional[asyncio.Future]
+
+
+class _Batch(NamedTuple):
+    entries: List[_Entry]
+    timer: asyncio.TimerHandle
+
+
+def render_digest(entries: List[_Entry], window: float) -> Tuple[str, str]:
+    # Тема и HTML-текст письма, объединяющего несколько заявок
+    sections = [
+        f"<h3>Заявка {index} из {len(entries)}: {html.escape(entry.subject)}</h3>{entry.body}"
+        for index, entry in enumerate(entries, 1)
+    ]
+    intro = f"За {window:.0f} с поступило заявок: {len(entries)}.<br><br>"
+    return f"{DIGEST_SUBJECT}: {len(entries)}", intro + "<hr>".join(sections)
+
+
+class EmailDigest:
+    """
+    Объединение писем о заявках в дайджест при всплеске нагрузки.
+
+    Если за последние window секунд писем этим получателям не было, письмо
+    уходит сразу. Иначе оно ждет в пакете, пока не истечет окно или не
+    наберется max_items писем, и весь пакет отправляется одним HTML-письмом
+    со всеми вложениями (не поместившиеся в письмо заменяются ссылками).
+    Ожидающие результата получают успех или ошибку отправки дайджеста.
+    """
+
+    def __init__(self, window: float = EMAIL_DIGEST_WINDOW, max_items: int = EMAIL_DIGEST_MAX):
+        self.window = window
+        self.max_items = max(1, max_items)
+        self._batches: Dict[Tuple[str, ...], _Batch] = {}
+        self._last_sent: Dict[Tuple[str, ...], float] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return sum(len(batch.entries) for batch in self._batches.values())
+
+    async def send(self, subject: str, body: str, to_emails: List[str],
+                   attachments: Optional[List[str]] = None, wait: bool = True) -> bool:
+        loop = asyncio.get_running_loop()
+        key = tuple(to_emails)
+        now = loop.time()
+        if self._closed or (key not in self._batches and now - self._last_sent.get(key, -self.window) >= self.window):
+            # Спокойный период: одиночное письмо отправляется без задержки
+            self._last_sent[key] = now
+            return await send_email_async(subject, body, to_emails, True, attachments, wait=wait)
+
+        future = loop.create_future() if wait else None
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch([], loop.call_later(self.window, self._flush, key))
+        batch.entries.append(_Entry(subject, body, attachments or [], future))
+        if len(batch.entries) >= self.max_items:
+            self._flush(key)
+        if future is None:
+            return True
+        # Отмена ожидающего не отменяет отправку дайджеста
+        return await asyncio.shield(future)
+
+    def _flush(self, key: Tuple[str, ...]) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._last_sent[key] = loop.time()
+        task = loop.create_task(self._send(list(key), batch.entries))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, to_emails: List[str], entries: List[_Entry]) -> None:
+        if len(entries) == 1:
+            subject, body = entries[0].subject, entries[0].body
+        else:
+            subject, body = render_digest(entries, self.window)
+        attachments = [path for entry in entries for path in entry.attachments]
+        try:
+            result = await send_email_async(subject, body, to_emails, True, attachments)
+        except Exception as e:
+            logger.error("Ошибка отправки дайджеста: %s", e)
+            result = False
+        if len(entries) > 1:
+            logger.info("Дайджест из %s заявок %s", len(entries), 'отправлен' if result else 'не отправлен')
+        for entry in entries:
+            if entry.future is not None and not entry.future.done():
+                entry.future.set_result(result)
+
+    async def stop(self) -> None:
+        # Отправляет накопленные пакеты; вызывается до остановки отправщика email
+        self._closed = True
+        for key in list(self._batches):
+            self._flush(key)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+
+email_digest = EmailDigest()
+QUEUE_DEPTH.set_function(lambda: email_digest.pending, queue="email_digest")
+
+
+async def send_ticket_email(subject: str, body: str, to_emails: List[str],
+                            attachments: Optional[List[str]] = None, wait: bool = True) -> bool:
+    """HTML-письмо о заявке: через дайджест при EMAIL_DIGEST, иначе отдельным письмом."""
+    if EMAIL_DIGEST:
+        return await email_digest.send(subject, body, to_emails, attachments, wait=wait)
+    return await send_email_async(subject, body, to_emails, True, attachments, wait=wait)
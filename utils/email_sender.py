@@ -1,17 +1,17 @@
+import asyncio
 import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from date.config import EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, EMAIL_RECEIVER
-from email.mime.base import MIMEBase
-from email import encoders
+import time
+from concurrent.futures import ThreadPoolExecutor
+from date.config import (
+    EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, EMAIL_RECEIVER,
+    EMAIL_WORKERS, EMAIL_QUEUE_SIZE, EMAIL_TIMEOUT, EMAIL_KEEPALIVE_CHECK,
+    EMAIL_MAX_SIZE, EMAIL_ATTACHMENT_URL, ATTACHMENTS_DIR,
+)
 import logging
-import os
-from email.header import Header
-from email.utils import encode_rfc2231
 from typing import Optional, List
+from utils.metrics import STAGE_SECONDS, EMAILS, QUEUE_DEPTH
+from utils.mime_stream import StreamingMessage, append_references, plan_attachments, send_streaming
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -25,6 +25,9 @@ def send_email(
     """
     Отправляет email с вложениями на несколько адресов.
 
+    Синхронная обертка для совместимости: открывает отдельную SMTP-сессию
+    и блокирует поток. Из асинхронного кода используйте send_email_async.
+
     Args:
         subject: Тема письма
         body: Текст письма
@@ -36,54 +39,213 @@ def send_email(
         bool: Успешность отправки
     """
     try:
-        # Проверка, что to_emails - это список
-        if not isinstance(to_emails, list):
-            raise ValueError("to_emails должен быть списком адресов электронной почты")
-
-        # Проверка, что все элементы списка - строки
-        if not all(isinstance(email, str) for email in to_emails):
-            raise ValueError("Все элементы to_emails должны быть строками")
-
-        msg = MIMEMultipart()
-        msg["Subject"] = subject
-        msg["From"] = EMAIL_USER
-        msg["To"] = ", ".join(to_emails)  # Для заголовка письма
+        msg = build_message(subject, body, to_emails, is_html, attachments)
 
-        msg.attach(MIMEText(body, "html" if is_html else "plain"))
-
-        if attachments:
-            for file_path in attachments:
-                if not os.path.exists(file_path):
-                    logger.error(f"Файл не найден: {file_path}")
-                    continue
-                attach_file(msg, file_path)
-
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
+        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_TIMEOUT) as server:
             server.starttls()
             server.login(EMAIL_USER, EMAIL_PASSWORD)
-            # Отправка на список адресов
-            server.sendmail(EMAIL_USER, to_emails, msg.as_string())
+            # Отправка на список адресов, вложения передаются по частям
+            send_streaming(server, msg)
 
-        logger.info(f"Письмо успешно отправлено на {len(to_emails)} адресов")
+        logger.info("Письмо успешно отправлено на %s адресов", len(to_emails))
         return True
 
     except Exception as e:
-        logger.error(f"Ошибка отправки письма: {e}")
+        logger.error("Ошибка отправки письма: %s", e)
         return False
 
 
-def attach_file(msg: MIMEMultipart, file_path: str) -> None:
-    """Добавляет файл к письму."""
-    try:
-        with open(file_path, 'rb') as f:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(f.read())
-            encoders.encode_base64(part)
+def build_message(
+        subject: str,
+        body: str,
+        to_emails: List[str],
+        is_html: bool = False,
+        attachments: Optional[List[str]] = None
+) -> StreamingMessage:
+    """
+    Проверяет получателей и готовит письмо с вложениями.
+
+    Файлы не читаются заранее: они кодируются по частям при отправке.
+    Вложения сверх EMAIL_MAX_SIZE заменяются в тексте письма ссылками.
+    """
+    # Проверка, что to_emails - это список
+    if not isinstance(to_emails, list):
+        raise ValueError("to_emails должен быть списком адресов электронной почты")
+
+    # Проверка, что все элементы списка - строки
+    if not all(isinstance(email, str) for email in to_emails):
+        raise ValueError("Все элементы to_emails должны быть строками")
+
+    # Запас на заголовки и текст письма
+    budget = max(EMAIL_MAX_SIZE - len(body.encode()) * 2 - 4096, 1) if EMAIL_MAX_SIZE else 0
+    attached, references = plan_attachments(attachments or [], budget, ATTACHMENTS_DIR, EMAIL_ATTACHMENT_URL)
+    body = append_references(body, references, is_html)
+    return StreamingMessage(subject, body, EMAIL_USER, to_emails, is_html, attached)
+
+
+class _SmtpSession:
+    """Постоянное авторизованное SMTP-соединение одного воркера."""
+
+    def __init__(self):
+        self.server: Optional[smtplib.SMTP] = None
+        self.last_used = 0.0
+
+    def connect(self) -> None:
+        self.close()
+        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_TIMEOUT)
+        server.starttls()
+        server.login(EMAIL_USER, EMAIL_PASSWORD)
+        self.server = server
+        self.last_used = time.monotonic()
+
+    def ensure_connected(self) -> None:
+        # Соединение, простоявшее дольше EMAIL_KEEPALIVE_CHECK, проверяется через NOOP
+        if self.server is None:
+            self.connect()
+            return
+        if time.monotonic() - self.last_used > EMAIL_KEEPALIVE_CHECK:
+            try:
+                code, _ = self.server.noop()
+                if code != 250:
+                    self.connect()
+            except smtplib.SMTPException:
+                self.connect()
+            except OSError:
+                self.connect()
+
+    def send(self, msg: StreamingMessage) -> None:
+        self.ensure_connected()
+        try:
+            send_streaming(self.server, msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Сервер закрыл соединение: переподключаемся и повторяем один раз (файлы читаются заново)
+            self.connect()
+            send_streaming(self.server, msg)
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self.server is None:
+            return
+        server, self.server = self.server, None
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
+class AsyncEmailSender:
+    """
+    Неблокирующая отправка писем.
 
-        filename = os.path.basename(file_path)
-        encoded_name = encode_rfc2231(filename, charset='utf-8')
-        part.add_header('Content-Disposition', 'attachment', filename=encoded_name)
+    Письма складываются в ограниченную очередь и разбираются пулом воркеров.
+    У каждого воркера свое постоянное SMTP-соединение, которое переживает
+    отдельные письма и переоткрывается при обрыве. Сетевой обмен с SMTP
+    выполняется в выделенном пуле потоков, поэтому event loop не блокируется.
+    """
 
-        msg.attach(part)
-    except Exception as e:
-        logger.error(f"Ошибка добавления вложения {file_path}: {e}")
\ No newline at end of file
+    def __init__(self, workers: int = EMAIL_WORKERS, queue_size: int = EMAIL_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="smtp")
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"email-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info("Запущено воркеров отправки email: %s", self.workers)
+
+    async def stop(self, timeout: float = 30) -> None:
+        # Дожидаемся отправки уже поставленных писем, затем останавливаем воркеры
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("В очереди email остались неотправленные письма: %s", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def send(
+            self,
+            subject: str,
+            body: str,
+            to_emails: List[str],
+            is_html: bool = False,
+            attachments: Optional[List[str]] = None,
+            wait: bool = True
+    ) -> bool:
+        """
+        Ставит письмо в очередь на отправку.
+
+        При wait=True дожидается результата отправки, при wait=False
+        возвращает True сразу после постановки в очередь.
+        """
+        if not self.running:
+            await self.start()
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put((subject, body, to_emails, is_html, attachments, future))
+        if future is None:
+            return True
+        return await future
+
+    async def _worker(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        session = _SmtpSession()
+        try:
+            while True:
+                subject, body, to_emails, is_html, attachments, future = await self._queue.get()
+                try:
+                    with STAGE_SECONDS.time(stage="send_email"):
+                        msg = build_message(subject, body, to_emails, is_html, attachments)
+                        await loop.run_in_executor(self._executor, session.send, msg)
+                    logger.info("Письмо успешно отправлено на %s адресов (воркер %s)", len(to_emails), index)
+                    result = True
+                except Exception as e:
+                    logger.error("Ошибка отправки письма: %s", e)
+                    session.close()
+                    result = False
+                finally:
+                    self._queue.task_done()
+                EMAILS.inc(result="sent" if result else "failed")
+                if future is not None and not future.done():
+                    future.set_result(result)
+        finally:
+            if self._executor is not None:
+                await loop.run_in_executor(self._executor, session.close)
+            else:
+                session.close()
+
+
+# Общий отправщик приложения (запускается в on_startup, останавливается в on_shutdown)
+email_sender = AsyncEmailSender()
+QUEUE_DEPTH.set_function(email_sender.qsize, queue="email")
+
+
+async def send_email_async(
+        subject: str,
+        body: str,
+        to_emails: List[str],
+        is_html: bool = False,
+        attachments: Optional[List[str]] = None,
+        wait: bool = True
+) -> bool:
+    """Асинхронный аналог send_email через общий пул воркеров."""
+    return await email_sender.send(subject, body, to_emails, is_html, attachments, wait=wait)
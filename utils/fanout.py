@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, TypeVar
+from aiogram.utils.exceptions import RetryAfter
+from date.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+    FANOUT_CONCURRENCY, FANOUT_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: при нехватке токенов возвращает время ожидания."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def block_for(self, seconds: float, now: float) -> None:
+        # Запрещает отправку на seconds секунд (ответ RetryAfter от Telegram)
+        self.updated = now
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class TelegramRateLimiter:
+    """
+    Ограничитель частоты запросов к Bot API.
+
+    Общий лимит бота (TELEGRAM_GLOBAL_RATE в секунду) и лимит на отдельный чат
+    (TELEGRAM_CHAT_RATE в секунду с запасом TELEGRAM_CHAT_BURST).
+    """
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: int = TELEGRAM_CHAT_BURST, max_chats: int = 10000):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._global: Optional[TokenBucket] = None
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            if len(self._chats) > self.max_chats:
+                # Вытесняем самый давний чат
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        # Сначала ждем слот чата, затем - общий слот бота
+        delay = self._chat_bucket(chat_id, loop.time()).reserve(loop.time())
+        if delay:
+            await asyncio.sleep(delay)
+        if self._global is None:
+            self._global = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        delay = self._global.reserve(loop.time())
+        if delay:
+            await asyncio.sleep(delay)
+
+    def retry_after(self, chat_id: int, seconds: float) -> None:
+        now = asyncio.get_running_loop().time()
+        self._chat_bucket(chat_id, now).block_for(seconds, now)
+
+
+# Общий ограничитель приложения
+rate_limiter = TelegramRateLimiter()
+
+
+async def limited_call(chat_id: int, request: Callable[[], Awaitable[T]],
+                       max_retries: int = FANOUT_MAX_RETRIES) -> T:
+    # Выполняет запрос к Bot API с учетом лимитов; RetryAfter переносит запрос, а не роняет его
+    attempt = 0
+    while True:
+        await rate_limiter.acquire(chat_id)
+        try:
+            return await request()
+        except RetryAfter as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            logger.warning("Flood control для чата %s: повтор через %s с", chat_id, e.timeout)
+            rate_limiter.retry_after(chat_id, e.timeout)
+
+
+class FanOutResult(NamedTuple):
+    ok: bool
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+async def fan_out(chat_ids: Iterable[int], send: Callable[[int], Awaitable[Any]],
+                  concurrency: int = FANOUT_CONCURRENCY) -> Dict[int, FanOutResult]:
+    """
+    Параллельно выполняет send(chat_id) для каждого получателя.
+
+    Число одновременных отправок ограничено concurrency. Ошибки не прерывают
+    рассылку и возвращаются в результате по каждому получателю.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(chat_id: int):
+        async with semaphore:
+            try:
+                return chat_id, FanOutResult(True, await send(chat_id))
+            except Exception as e:
+                return chat_id, FanOutResult(False, error=e)
+
+    recipients = list(dict.fromkeys(chat_ids))
+    return dict(await asyncio.gather(*(run(chat_id) for chat_id in recipients)))
+
+
+def sent_file_id(message) -> Optional[str]:
+    # Возвращает file_id вложения из отправленного ботом сообщения
+    if message is None:
+        return None
+    if message.document:
+        return message.document.file_id
+    if message.photo:
+        return message.photo[-1].file_id
+    return None
+
+
+async def fan_out_file(chat_ids: Iterable[int], send: Callable[[int, Optional[str]], Awaitable[Optional[str]]],
+                       file_id: Optional[str] = None,
+                       concurrency: int = FANOUT_CONCURRENCY) -> Dict[int, FanOutResult]:
+    """
+    Рассылка с вложением, которое загружается в Telegram не более одного раза.
+
+    send(chat_id, file_id) отправляет сообщение и возвращает file_id вложения.
+    Если file_id заранее неизвестен, файл загружается первому получателю,
+    а остальным отправляется по полученному file_id параллельно.
+    """
+    recipients = list(dict.fromkeys(chat_ids))
+    results: Dict[int, FanOutResult] = {}
+    while file_id is None and recipients:
+        chat_id = recipients.pop(0)
+        results.update(await fan_out([chat_id], lambda c: send(c, None)))
+        if results[chat_id].ok:
+            file_id = results[chat_id].result
+            if file_id is None:
+                # Вложения нет - загружать нечего
+                break
+    results.update(await fan_out(recipients, lambda c: send(c, file_id), concurrency))
+    return results
@@ -0,0 +1,226 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+import typing
+from collections import OrderedDict
+from aiogram.dispatcher.storage import BaseStorage
+from date.config import FSM_CACHE_TTL, FSM_STATE_TTL, FSM_CLEANUP_INTERVAL
+from utils.database import get_connection
+
+logger = logging.getLogger(__name__)
+
+Key = typing.Tuple[int, int]
+
+
+class _Record:
+    __slots__ = ("state", "data", "bucket", "dirty", "touched")
+
+    def __init__(self, state: typing.Optional[str] = None, data: dict = None, bucket: dict = None):
+        self.state = state
+        self.data = data or {}
+        self.bucket = bucket or {}
+        self.dirty = False
+        self.touched = time.monotonic()
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data and not self.bucket
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в PostgreSQL с кэшем отложенной записи.
+
+    Изменения состояния, данных и bucket копятся в кэше процесса и
+    записываются одним UPSERT при flush() - FSMFlushMiddleware вызывает его
+    после обработки каждого обновления. Записи кэша живут FSM_CACHE_TTL
+    секунд, строки без изменений дольше FSM_STATE_TTL удаляются из таблицы.
+    """
+
+    def __init__(self, cache_ttl: float = FSM_CACHE_TTL, state_ttl: float = FSM_STATE_TTL,
+                 cleanup_interval: float = FSM_CLEANUP_INTERVAL, max_cached: int = 10000):
+        self.cache_ttl = cache_ttl
+        self.state_ttl = state_ttl
+        self.cleanup_interval = cleanup_interval
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[Key, _Record]" = OrderedDict()
+        self._cleanup_task: typing.Optional[asyncio.Task] = None
+
+    def _key(self, chat, user) -> Key:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    async def _record(self, chat, user) -> _Record:
+        key = self._key(chat, user)
+        now = time.monotonic()
+        record = self._cache.get(key)
+        if record is not None and (record.dirty or now - record.touched < self.cache_ttl):
+            record.touched = now
+            self._cache.move_to_end(key)
+            return record
+
+        async with get_connection() as conn:
+            row = await conn.fetchrow(
+                "SELECT state, data, bucket FROM fsm_storage "
+                "WHERE chat_id = $1 AND user_id = $2 AND updated_at > NOW() - make_interval(secs => $3)",
+                key[0], key[1], self.state_ttl
+            )
+        loaded = _Record(row["state"], json.loads(row["data"]), json.loads(row["bucket"])) if row else _Record()
+        # Пока шел запрос, запись могла появиться и измениться в другом обработчике
+        current = self._cache.get(key)
+        if current is not None and current.dirty:
+            return current
+        self._cache[key] = loaded
+        self._cache.move_to_end(key)
+        self._evict()
+        return loaded
+
+    def _evict(self) -> None:
+        # Вытесняем самые давние записи, уже сохраненные в БД
+        while len(self._cache) > self.max_cached:
+            key, record = next(iter(self._cache.items()))
+            if record.dirty:
+                break
+            self._cache.popitem(last=False)
+
+    async def flush(self) -> None:
+        # Записывает все измененные записи: одна строка на (chat, user) за вызов
+        dirty = [(key, record) for key, record in self._cache.items() if record.dirty]
+        if not dirty:
+            return
+        upserts, deletes = [], []
+        for key, record in dirty:
+            record.dirty = False
+            if record.is_empty():
+                deletes.append(key)
+            else:
+                upserts.append((key[0], key[1], record.state,
+                                json.dumps(record.data, ensure_ascii=False),
+                                json.dumps(record.bucket, ensure_ascii=False)))
+        try:
+            async with get_connection() as conn:
+                async with conn.transaction():
+                    if upserts:
+                        await conn.executemany(
+                            """
+                            INSERT INTO fsm_storage (chat_id, user_id, state, data, bucket, updated_at)
+                            VALUES ($1, $2, $3, $4::jsonb, $5::jsonb, NOW())
+                            ON CONFLICT (chat_id, user_id) DO UPDATE
+                            SET state = EXCLUDED.state, data = EXCLUDED.data,
+                                bucket = EXCLUDED.bucket, updated_at = NOW()
+                            """,
+                            upserts
+                        )
+                    if deletes:
+                        await conn.executemany(
+                            "DELETE FROM fsm_storage WHERE chat_id = $1 AND user_id = $2", deletes
+                        )
+        except Exception:
+            # Не удалось записать - оставляем записи грязными до следующего flush
+            for _, record in dirty:
+                record.dirty = True
+            raise
+
+    def stats(self) -> typing.Tuple[int, int]:
+        # Число записей в кэше и из них еще не записанных в БД
+        return len(self._cache), sum(1 for record in self._cache.values() if record.dirty)
+
+    def start_cleanup(self) -> None:
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop(), name="fsm-storage-cleanup")
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                async with get_connection() as conn:
+                    result = await conn.execute(
+                        "DELETE FROM fsm_storage WHERE updated_at < NOW() - make_interval(secs => $1)",
+                        self.state_ttl
+                    )
+                logger.info("Очистка устаревших состояний FSM: %s", result)
+            except Exception as e:
+                logger.error("Ошибка очистки состояний FSM: %s", e)
+            now = time.monotonic()
+            for key in [k for k, r in self._cache.items() if not r.dirty and now - r.touched >= self.cache_ttl]:
+                del self._cache[key]
+
+    async def close(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+        await self.flush()
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        record = await self._record(chat, user)
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[typing.Dict] = None) -> typing.Dict:
+        record = await self._record(chat, user)
+        if not record.data:
+            return copy.deepcopy(default) if default is not None else {}
+        return copy.deepcopy(record.data)
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        record = await self._record(chat, user)
+        record.state = self.resolve_state(state)
+        record.dirty = True
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        record = await self._record(chat, user)
+        record.data = copy.deepcopy(data) if data else {}
+        record.dirty = True
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None,
+                          **kwargs):
+        record = await self._record(chat, user)
+        record.data.update(data or {}, **kwargs)
+        record.dirty = True
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._record(chat, user)
+        if not record.bucket:
+            return copy.deepcopy(default) if default is not None else {}
+        return copy.deepcopy(record.bucket)
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        record = await self._record(chat, user)
+        record.bucket = copy.deepcopy(bucket) if bucket else {}
+        record.dirty = True
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None,
+                            **kwargs):
+        record = await self._record(chat, user)
+        record.bucket.update(bucket or {}, **kwargs)
+        record.dirty = True
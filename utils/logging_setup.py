@@ -0,0 +1,134 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from typing import Iterable, Optional
+from date.config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_SAMPLED_LOGGERS
+
+# Контекст обрабатываемого обновления; задается LogContextMiddleware
+update_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("update_id", default=None)
+chat_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("chat_id", default=None)
+
+# Поля LogRecord, которые не выводятся как дополнительные (extra)
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    # Добавляет к записи update_id и chat_id; подключается к обработчику на стороне вызывающего кода,
+    # так как contextvars обновления не видны из потока QueueListener
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id = update_id_var.get()
+        record.chat_id = chat_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю rate частых записей.
+
+    Выборке подлежат записи уровня DEBUG и записи ниже WARNING от логгеров
+    из loggers (например, журнал каждого обновления aiogram). Предупреждения
+    и ошибки не отбрасываются никогда.
+    """
+
+    def __init__(self, rate: float, loggers: Iterable[str] = ()):
+        super().__init__()
+        self.rate = rate
+        self.loggers = tuple(loggers)
+
+    def _sampled(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG:
+            return True
+        return record.levelno < logging.WARNING and any(
+            record.name == name or record.name.startswith(name + ".") for name in self.loggers
+        )
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or not self._sampled(record):
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись - одна строка JSON
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [update=%(update_id)s chat=%(chat_id)s] %(message)s")
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Передает записи в очередь без форматирования.
+
+    В потоке event loop подставляются только аргументы сообщения (%-формат);
+    JSON, трассировки исключений и запись в поток выполняет QueueListener
+    в отдельном потоке.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы могут измениться после вызова логгера, поэтому сообщение фиксируется сразу
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, sample_rate: float = LOG_SAMPLE_RATE,
+                  sampled_loggers: Iterable[str] = LOG_SAMPLED_LOGGERS) -> None:
+    """
+    Настраивает корневой логгер: записи через очередь уходят в фоновый поток.
+
+    Повторный вызов ничего не делает. Вызывается один раз при запуске процесса.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler = _QueueHandler(queue.SimpleQueue())
+    # Фильтры обработчика выполняются в вызывающем потоке, где доступен контекст обновления
+    handler.addFilter(SamplingFilter(sample_rate, sampled_loggers))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    # Дописывает оставшиеся в очереди записи
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+from aiogram import Bot, types
+from aiogram.types import InputFile
+from aiogram.utils.exceptions import BadRequest
+from date.config import MEDIA_CACHE_CHAT_ID
+from utils.database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Статические файлы, которые прогреваются при старте
+WELCOME_PHOTO = "./img/tshed_logo.jpg"
+STATIC_MEDIA = (WELCOME_PHOTO,)
+
+
+class _Entry(NamedTuple):
+    sha256: str
+    file_id: str
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """
+    Кэш file_id для статических файлов бота.
+
+    Файл загружается в Telegram один раз, полученный file_id хранится в
+    таблице media_cache вместе с SHA-256 содержимого. Хэш пересчитывается
+    только при изменении размера или mtime файла; если содержимое поменялось,
+    запись считается устаревшей и файл загружается заново.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        # path -> ((mtime, size), sha256), чтобы не читать файл на каждый запрос
+        self._hashes: Dict[str, Tuple[Tuple[float, int], str]] = {}
+
+    async def file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        signature = (stat.st_mtime, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        sha256 = await asyncio.get_running_loop().run_in_executor(None, _file_sha256, path)
+        self._hashes[path] = (signature, sha256)
+        return sha256
+
+    async def get(self, path: str) -> Optional[str]:
+        # Возвращает file_id, если он соответствует текущему содержимому файла
+        sha256 = await self.file_hash(path)
+        entry = self._entries.get(path)
+        if entry is None:
+            async with get_connection() as conn:
+                row = await conn.fetchrow("SELECT sha256, file_id FROM media_cache WHERE path = $1", path)
+            if row is None:
+                return None
+            entry = self._entries[path] = _Entry(row["sha256"], row["file_id"])
+        return entry.file_id if entry.sha256 == sha256 else None
+
+    async def store(self, path: str, file_id: str) -> None:
+        sha256 = await self.file_hash(path)
+        self._entries[path] = _Entry(sha256, file_id)
+        async with get_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO media_cache (path, sha256, file_id, updated_at) VALUES ($1, $2, $3, NOW())
+                ON CONFLICT (path) DO UPDATE
+                SET sha256 = EXCLUDED.sha256, file_id = EXCLUDED.file_id, updated_at = NOW()
+                """,
+                path, sha256, file_id
+            )
+
+    def invalidate(self, path: str) -> None:
+        self._entries.pop(path, None)
+
+    async def send_photo(self, bot: Bot, chat_id: int, path: str, **kwargs) -> types.Message:
+        # Отправляет фото по кэшированному file_id, при его отсутствии - загружает файл и кэширует file_id
+        try:
+            file_id = await self.get(path)
+        except Exception as e:
+            logger.error("Ошибка чтения кэша медиа для %s: %s", path, e)
+            file_id = None
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id, file_id, **kwargs)
+            except BadRequest as e:
+                logger.warning("file_id для %s не принят Telegram, загружаем заново: %s", path, e)
+                self.invalidate(path)
+        message = await bot.send_photo(chat_id, InputFile(path), **kwargs)
+        try:
+            await self.store(path, message.photo[-1].file_id)
+        except Exception as e:
+            logger.error("Ошибка сохранения кэша медиа для %s: %s", path, e)
+        return message
+
+    async def _warm_one(self, bot: Bot, path: str, chat_id: int) -> None:
+        try:
+            if await self.get(path):
+                return
+            message = await self.send_photo(bot, chat_id, path, disable_notification=True)
+            await bot.delete_message(chat_id, message.message_id)
+            logger.info("Файл %s загружен в Telegram и закэширован", path)
+        except Exception as e:
+            logger.error("Не удалось прогреть кэш для %s: %s", path, e)
+
+    async def warm(self, bot: Bot, paths: Iterable[str] = STATIC_MEDIA, chat_id: int = MEDIA_CACHE_CHAT_ID) -> None:
+        # Параллельно проверяет и при необходимости загружает статические файлы
+        await asyncio.gather(*(self._warm_one(bot, path, chat_id) for path in paths))
+
+
+# Общий кэш медиа приложения
+media_cache = MediaCache()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from aiogram import Bot, types
+from date.config import MEDIA_GROUP_WINDOW, MEDIA_GROUP_MAX_WAIT
+from utils.fanout import limited_call
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает в sendMediaGroup от 2 до 10 файлов
+MEDIA_GROUP_LIMIT = 10
+
+# Сколько последних собранных альбомов помнится, чтобы отбросить опоздавшие части
+_CLOSED_KEYS = 1000
+
+
+class _Group:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.messages: List[types.Message] = []
+        self.started = loop.time()
+        self.future: asyncio.Future = loop.create_future()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MediaGroupCollector:
+    """
+    Сборка альбома (media group) из отдельных сообщений.
+
+    Каждая часть альбома приходит отдельным обновлением с общим
+    media_group_id. Обработчик первой части ждет, пока новые части перестанут
+    приходить (window секунд без частей, но не дольше max_wait), и получает
+    весь альбом; обработчики остальных частей получают None и завершаются,
+    не трогая FSM. Части, пришедшие после сборки альбома, отбрасываются.
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW, max_wait: float = MEDIA_GROUP_MAX_WAIT):
+        self.window = window
+        self.max_wait = max_wait
+        self._groups: Dict[Tuple[int, str], _Group] = {}
+        self._closed: "OrderedDict[Tuple[int, str], None]" = OrderedDict()
+
+    async def collect(self, message: types.Message) -> Optional[List[types.Message]]:
+        # Сообщения альбома по порядку - для первой части, None - для остальных
+        if not message.media_group_id:
+            return [message]
+        key = (message.chat.id, message.media_group_id)
+        if key in self._closed:
+            logger.warning("Часть альбома %s пришла после его сборки и пропущена", message.media_group_id)
+            return None
+        group = self._groups.get(key)
+        if group is not None:
+            group.messages.append(message)
+            self._schedule(key, group)
+            return None
+
+        loop = asyncio.get_running_loop()
+        group = self._groups[key] = _Group(loop)
+        group.messages.append(message)
+        self._schedule(key, group)
+        try:
+            # Сборка альбома не отменяется вместе с ожидающим обработчиком
+            return await asyncio.shield(group.future)
+        finally:
+            if self._groups.get(key) is group:
+                self._close(key)
+
+    def _schedule(self, key: Tuple[int, str], group: _Group) -> None:
+        # Окно продлевается с каждой новой частью, но не дальше max_wait от первой
+        loop = asyncio.get_running_loop()
+        if group.timer is not None:
+            group.timer.cancel()
+        delay = min(self.window, group.started + self.max_wait - loop.time())
+        group.timer = loop.call_later(max(delay, 0), self._close, key)
+
+    def _close(self, key: Tuple[int, str]) -> None:
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        group.timer.cancel()
+        self._closed[key] = None
+        while len(self._closed) > _CLOSED_KEYS:
+            self._closed.popitem(last=False)
+        if not group.future.done():
+            group.future.set_result(sorted(group.messages, key=lambda m: m.message_id))
+
+
+# Общий сборщик альбомов процесса
+media_groups = MediaGroupCollector()
+
+
+def message_file(message: types.Message) -> Optional[Tuple[str, str, Optional[str]]]:
+    # (file_id, тип, исходное имя) вложения сообщения: документ или самое крупное фото
+    if message.document:
+        return message.document.file_id, "document", message.document.file_name
+    if message.photo:
+        return message.photo[-1].file_id, "photo", None
+    return None
+
+
+def album_media(files: Iterable[dict]) -> List[List[types.InputMedia]]:
+    # Группы для sendMediaGroup по file_id: фото и документы не смешиваются, в группе до 10 файлов
+    files = list(files)
+    groups = []
+    for file_type, media_type in (("photo", types.InputMediaPhoto), ("document", types.InputMediaDocument)):
+        media = [media_type(file["file_id"]) for file in files if file["file_type"] == file_type]
+        groups.extend(media[i:i + MEDIA_GROUP_LIMIT] for i in range(0, len(media), MEDIA_GROUP_LIMIT))
+    return groups
+
+
+async def send_album(bot: Bot, chat_id: int, files: Iterable[dict]) -> None:
+    # Отправляет файлы альбома по file_id; одиночный остаток группы - обычным сообщением
+    for media in album_media(files):
+        if len(media) > 1:
+            await limited_call(chat_id, lambda: bot.send_media_group(chat_id, media))
+        elif isinstance(media[0], types.InputMediaPhoto):
+            await limited_call(chat_id, lambda: bot.send_photo(chat_id, media[0].media))
+        else:
+            await limited_call(chat_id, lambda: bot.send_document(chat_id, media[0].media))
@@ -0,0 +1,233 @@
+import logging
+import re
+from typing import List, NamedTuple, Tuple
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Имя индекса в CREATE INDEX CONCURRENTLY (миграции используют имена без кавычек)
+_CONCURRENT_INDEX = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)",
+                               re.IGNORECASE)
+
+# Ключ advisory lock: одновременно миграции применяет только один процесс
+MIGRATIONS_LOCK_KEY = 0x7453_6D69
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: Tuple[str, ...]
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    transactional: bool = True
+
+    @property
+    def concurrent_indexes(self) -> List[str]:
+        # Имена индексов, которые миграция строит через CREATE INDEX CONCURRENTLY
+        return [name.lower() for statement in self.statements for name in _CONCURRENT_INDEX.findall(statement)]
+
+
+# Миграции применяются по возрастанию version; примененные миграции не изменяются,
+# любое изменение схемы оформляется новой миграцией в конце списка.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial schema", (
+        """
+        CREATE TABLE IF NOT EXISTS support_requests (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NULL,
+            user_username TEXT NULL,
+            name TEXT NULL,
+            email TEXT NULL,
+            message TEXT NULL,
+            admin_id BIGINT NULL,
+            admin_name TEXT NULL,
+            document_id TEXT,
+            photo_id TEXT,
+            document_path TEXT,
+            photo_path TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS support_responses (
+            id SERIAL PRIMARY KEY,
+            request_id INT REFERENCES support_requests(id),
+            admin_id BIGINT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload JSONB NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT NOW(),
+            sent_at TIMESTAMP
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS outbox_pending_idx
+            ON outbox (next_attempt_at) WHERE sent_at IS NULL;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            chat_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            bucket JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (chat_id, user_id)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS fsm_storage_updated_at_idx ON fsm_storage (updated_at);
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS media_cache (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+    )),
+    # Индексы для выборок заявок по пользователю, администратору и дате, а также ответов по заявке.
+    # Строятся без блокировки записи, так как таблицы на рабочих базах уже заполнены.
+    Migration(2, "support indexes", (
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS support_requests_user_id_idx
+            ON support_requests (user_id, created_at);
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS support_requests_admin_id_idx
+            ON support_requests (admin_id, created_at);
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS support_requests_created_at_idx
+            ON support_requests (created_at, id);
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS support_responses_request_id_idx
+            ON support_responses (request_id);
+        """,
+    ), transactional=False),
+    # Полнотекстовый поиск по заявкам: вектор поддерживается самой СУБД (generated column),
+    # имя весит больше текста обращения
+    Migration(3, "support full-text search", (
+        """
+        ALTER TABLE support_requests ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(message, '')), 'B')
+            ) STORED;
+        """,
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS support_requests_search_idx
+            ON support_requests USING GIN (search_vector);
+        """,
+    ), transactional=False),
+    # Хранилище вложений с адресацией по SHA-256: файл и число ссылающихся на него заявок.
+    # Удаление связи (в том числе вместе с заявкой) уменьшает счетчик ссылок.
+    Migration(4, "attachment store", (
+        """
+        CREATE TABLE IF NOT EXISTS attachments (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            refcount INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            last_used_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS attachments_last_used_at_idx ON attachments (last_used_at);
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ticket_attachments (
+            request_id INT NOT NULL REFERENCES support_requests(id) ON DELETE CASCADE,
+            sha256 TEXT NOT NULL REFERENCES attachments(sha256) ON DELETE CASCADE,
+            PRIMARY KEY (request_id, sha256)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ticket_attachments_sha256_idx ON ticket_attachments (sha256);
+        """,
+        """
+        CREATE OR REPLACE FUNCTION ticket_attachments_unref() RETURNS trigger AS $$
+        BEGIN
+            UPDATE attachments SET refcount = refcount - 1 WHERE sha256 = OLD.sha256;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE TRIGGER ticket_attachments_unref AFTER DELETE ON ticket_attachments
+            FOR EACH ROW EXECUTE FUNCTION ticket_attachments_unref();
+        """,
+    )),
+]
+
+
+async def _drop_invalid_indexes(conn: asyncpg.Connection, indexes: List[str]) -> None:
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс, который IF NOT EXISTS не пересоздаст.
+    # Удаляются только индексы этой миграции: чужие невалидные индексы могут строиться прямо сейчас
+    if not indexes:
+        return
+    names = await conn.fetch(
+        """
+        SELECT c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid AND n.nspname = current_schema() AND c.relname = ANY($1::text[])
+        """,
+        indexes
+    )
+    for row in names:
+        logger.warning("Удаляется невалидный индекс %s", row['relname'])
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{row["relname"]}"')
+
+
+async def _apply(conn: asyncpg.Connection, migration: Migration) -> None:
+    record = "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)"
+    if migration.transactional:
+        async with conn.transaction():
+            for statement in migration.statements:
+                await conn.execute(statement)
+            await conn.execute(record, migration.version, migration.name)
+    else:
+        await _drop_invalid_indexes(conn, migration.concurrent_indexes)
+        for statement in migration.statements:
+            await conn.execute(statement)
+        await conn.execute(record, migration.version, migration.name)
+
+
+async def migrate(conn: asyncpg.Connection) -> List[int]:
+    # Применяет недостающие миграции; возвращает номера примененных версий
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_KEY)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        current = await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        applied = []
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version <= current:
+                continue
+            logger.info("Применяется миграция %s: %s", migration.version, migration.name)
+            await _apply(conn, migration)
+            applied.append(migration.version)
+        if applied:
+            logger.info("Схема БД обновлена до версии %s", applied[-1])
+        else:
+            logger.info("Схема БД актуальна (версия %s)", current)
+        return applied
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
@@ -0,0 +1,193 @@
+import base64
+import html
+import logging
+import os
+import smtplib
+import uuid
+from email import generator
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import encode_rfc2231
+from io import BytesIO
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# 57 байт исходных данных - одна строка base64 из 76 символов
+_LINE_BYTES = 57
+_LINE_CHARS = 76
+# Сколько байт файла читается и кодируется за раз
+STREAM_CHUNK_LINES = 1024
+
+
+class Attachment(NamedTuple):
+    path: str
+    filename: str
+    size: int
+
+
+def encoded_size(size: int) -> int:
+    # Размер вложения в base64 со строками по 76 символов и CRLF
+    chars = 4 * ((size + 2) // 3)
+    return chars + 2 * ((chars + _LINE_CHARS - 1) // _LINE_CHARS)
+
+
+def _human_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} МБ"
+    return f"{size / 1024:.0f} КБ"
+
+
+def _dot_stuff(data: bytes) -> bytes:
+    # Строка, начинающаяся с точки, в SMTP DATA экранируется второй точкой (RFC 5321, 4.5.2)
+    if data.startswith(b"."):
+        data = b"." + data
+    return data.replace(b"\r\n.", b"\r\n..")
+
+
+def _base64_lines(path: str, chunk_lines: int = STREAM_CHUNK_LINES) -> Iterator[bytes]:
+    # Кодирует файл в base64 частями, не загружая его в память целиком
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_LINE_BYTES * chunk_lines)
+            if not chunk:
+                return
+            encoded = base64.b64encode(chunk)
+            yield b"".join(encoded[i:i + _LINE_CHARS] + b"\r\n" for i in range(0, len(encoded), _LINE_CHARS))
+
+
+class StreamingMessage:
+    """
+    Письмо с вложениями, которое формируется по частям во время передачи.
+
+    Заголовки и границы частей собирает пакет email (части-вложения содержат
+    маркер вместо данных), а содержимое файлов кодируется в base64 блоками
+    прямо в поток SMTP DATA. В памяти одновременно находится только один
+    блок, а не файл и две его копии (base64 и as_string()).
+    """
+
+    def __init__(self, subject: str, body: str, sender: str, to_emails: List[str], is_html: bool = False,
+                 attachments: Optional[List[Attachment]] = None):
+        self.subject = subject
+        self.sender = sender
+        self.to_emails = to_emails
+        self.attachments = attachments or []
+        self._markers: Dict[bytes, Attachment] = {}
+
+        msg = MIMEMultipart()
+        msg["Subject"] = subject
+        msg["From"] = sender
+        msg["To"] = ", ".join(to_emails)  # Для заголовка письма
+        msg.attach(MIMEText(body, "html" if is_html else "plain"))
+        for attachment in self.attachments:
+            marker = f"@@attachment-{uuid.uuid4().hex}@@".encode()
+            self._markers[marker] = attachment
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(marker.decode())
+            part["Content-Transfer-Encoding"] = "base64"
+            part.add_header("Content-Disposition", "attachment",
+                            filename=encode_rfc2231(attachment.filename, charset="utf-8"))
+            msg.attach(part)
+
+        buffer = BytesIO()
+        generator.BytesGenerator(buffer, policy=msg.policy.clone(linesep="\r\n")).flatten(msg)
+        self._skeleton = buffer.getvalue()
+
+    @property
+    def size(self) -> int:
+        # Итоговый размер письма без учета экранирования точек
+        skeleton = len(self._skeleton) - sum(len(marker) for marker in self._markers)
+        return skeleton + sum(encoded_size(a.size) - 2 for a in self._markers.values())
+
+    def chunks(self) -> Iterator[bytes]:
+        # Данные письма для SMTP DATA: CRLF, экранированные точки, без завершающей строки "."
+        rest = self._skeleton
+        for marker, attachment in self._markers.items():
+            head, rest = rest.split(marker, 1)
+            yield _dot_stuff(head)
+            encoded = b""
+            for encoded in _base64_lines(attachment.path):
+                yield encoded
+            # Строка после маркера начинается с CRLF, который уже добавлен к последней строке base64
+            if encoded and rest.startswith(b"\r\n"):
+                rest = rest[2:]
+        yield _dot_stuff(rest)
+
+
+def send_streaming(server: smtplib.SMTP, message: StreamingMessage) -> Dict[str, Tuple[int, bytes]]:
+    """
+    Отправляет письмо через открытое соединение, передавая данные по частям.
+
+    Повторяет протокол smtplib.SMTP.sendmail (MAIL, RCPT, DATA), но тело
+    письма не собирается в одну строку. Возвращает отклоненных получателей.
+    """
+    server.ehlo_or_helo_if_needed()
+    options = [f"SIZE={message.size}"] if server.has_extn("size") else []
+    code, response = server.mail(message.sender, options)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, message.sender)
+    refused = {}
+    for address in message.to_emails:
+        code, response = server.rcpt(address)
+        if code not in (250, 251):
+            refused[address] = (code, response)
+    if len(refused) == len(message.to_emails):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, response = server.docmd("data")
+    if code != 354:
+        raise smtplib.SMTPDataError(code, response)
+    tail = b""
+    for chunk in message.chunks():
+        server.send(chunk)
+        tail = (tail + chunk)[-2:]
+    server.send(b".\r\n" if tail == b"\r\n" else b"\r\n.\r\n")
+    code, response = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+
+def plan_attachments(paths: List[str], budget: int, stored_root: str,
+                     base_url: str = "") -> Tuple[List[Attachment], List[str]]:
+    """
+    Делит файлы на вложения и ссылки так, чтобы письмо уложилось в budget байт.
+
+    Файлы добавляются по порядку, пока суммарный размер в base64 не превышает
+    бюджет; остальные заменяются ссылкой (base_url + путь в хранилище
+    вложений) или указанием пути к файлу на сервере. budget=0 - без ограничения.
+    """
+    attached, references = [], []
+    used = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            logger.error("Файл не найден: %s", path)
+            continue
+        filename = os.path.basename(path)
+        if not budget or used + encoded_size(size) <= budget:
+            attached.append(Attachment(path, filename, size))
+            used += encoded_size(size)
+            continue
+        relative = os.path.relpath(path, stored_root)
+        if base_url and not relative.startswith(".."):
+            location = f"{base_url.rstrip('/')}/{quote(relative.replace(os.sep, '/'))}"
+        else:
+            location = f"файл на сервере: {path}"
+        references.append(f"{filename} ({_human_size(size)}) не вложен из-за размера письма, {location}")
+        logger.info("Вложение %s (%s байт) заменено ссылкой: превышен размер письма", path, size)
+    return attached, references
+
+
+def append_references(body: str, references: List[str], is_html: bool) -> str:
+    # Добавляет в текст письма список файлов, замененных ссылками
+    if not references:
+        return body
+    if is_html:
+        items = "".join(f"<li>{html.escape(reference)}</li>" for reference in references)
+        return f"{body}<br><br>Вложения, не поместившиеся в письмо:<ul>{items}</ul>"
+    return body + "\n\nВложения, не поместившиеся в письмо:\n" + "\n".join(f"- {r}" for r in references)
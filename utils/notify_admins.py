@@ -1,18 +1,18 @@
 import logging
 from aiogram import Dispatcher
 from date.config import ADMIN_IDS
+from utils.fanout import fan_out, limited_call
+
+
+async def _broadcast(dp: Dispatcher, text: str):
+    results = await fan_out(ADMIN_IDS, lambda admin: limited_call(admin, lambda: dp.bot.send_message(admin, text)))
+    for admin, result in results.items():
+        if not result.ok:
+            logging.exception(result.error, exc_info=result.error)
 
 #Уведомления админа при запуске или остановке бота
 async def on_startup_notify(dp: Dispatcher):
-    for admin in ADMIN_IDS:
-        try:
-            await dp.bot.send_message(admin, "Бот запущен")
-        except Exception as err:
-            logging.exception(err)
+    await _broadcast(dp, "Бот запущен")
 
 async def on_shutdown_notify(dp: Dispatcher):
-    for admin in ADMIN_IDS:
-        try:
-            await dp.bot.send_message(admin, "Бот остановлен")
-        except Exception as err:
-            logging.exception(err)
\ No newline at end of file
+    await _broadcast(dp, "Бот остановлен")
\ No newline at end of file
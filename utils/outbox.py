@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from aiogram import Bot
+from date.config import (
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX, OUTBOX_LEASE,
+)
+from utils.database import get_connection
+from utils.metrics import STAGE_SECONDS, STAGE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Обработчики доставки по типу записи: kind -> async handler(bot, payload)
+OutboxHandler = Callable[[Bot, dict], Awaitable[None]]
+_handlers: Dict[str, OutboxHandler] = {}
+
+
+class RetryLater(Exception):
+    """
+    Доставка выполнена частично или временно невозможна.
+
+    Если указан payload, при следующей попытке обработчик получит его
+    вместо исходного (например, только не получившие уведомление адресаты).
+    """
+
+    def __init__(self, message: str, payload: Optional[dict] = None):
+        super().__init__(message)
+        self.payload = payload
+
+
+def outbox_handler(kind: str):
+    # Регистрирует обработчик доставки для записей outbox с указанным kind
+    def decorator(func: OutboxHandler) -> OutboxHandler:
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+async def enqueue(conn, kind: str, payload: dict) -> int:
+    # Добавляет запись в outbox в рамках транзакции вызывающего кода
+    return await conn.fetchval(
+        "INSERT INTO outbox (kind, payload) VALUES ($1, $2::jsonb) RETURNING id",
+        kind, json.dumps(payload, ensure_ascii=False)
+    )
+
+
+async def enqueue_many(conn, items: List[Tuple[str, dict]]) -> None:
+    # Добавляет несколько записей (kind, payload) одним пакетом запросов
+    await conn.executemany(
+        "INSERT INTO outbox (kind, payload) VALUES ($1, $2::jsonb)",
+        [(kind, json.dumps(payload, ensure_ascii=False)) for kind, payload in items]
+    )
+
+
+def backoff_delay(attempts: int) -> float:
+    # Экспоненциальная задержка с небольшим джиттером
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), OUTBOX_BACKOFF_MAX)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+class OutboxDispatcher:
+    """
+    Фоновый диспетчер outbox.
+
+    Пачками забирает готовые к отправке записи (FOR UPDATE SKIP LOCKED,
+    с арендой на OUTBOX_LEASE секунд), доставляет их параллельно и отмечает
+    результат. Неудачные попытки откладываются с экспоненциальной задержкой,
+    после OUTBOX_MAX_ATTEMPTS попыток запись остается в таблице для разбора.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def start(self, bot: Bot) -> None:
+        if self._task is not None:
+            return
+        self._bot = bot
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+        logger.info("Диспетчер outbox запущен")
+
+    def wake(self) -> None:
+        # Будит диспетчер сразу после коммита новой записи
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+            logger.info("Диспетчер outbox остановлен")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.dispatch_batch()
+            except Exception as e:
+                logger.error("Ошибка диспетчера outbox: %s", e)
+                processed = 0
+            # Полная пачка - вероятно, есть еще записи, продолжаем без ожидания
+            if processed >= self.batch_size or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim_batch(self) -> List[dict]:
+        async with get_connection() as conn:
+            rows = await conn.fetch(
+                """
+                UPDATE outbox SET next_attempt_at = NOW() + make_interval(secs => $3)
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE sent_at IS NULL AND attempts < $2 AND next_attempt_at <= NOW()
+                    ORDER BY id
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, kind, payload, attempts
+                """,
+                self.batch_size, OUTBOX_MAX_ATTEMPTS, OUTBOX_LEASE
+            )
+        return [
+            {"id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"]),
+             "attempts": row["attempts"]}
+            for row in rows
+        ]
+
+    async def dispatch_batch(self) -> int:
+        records = await self._claim_batch()
+        if records:
+            await asyncio.gather(*(self._deliver(record) for record in records))
+        return len(records)
+
+    async def _deliver(self, record: dict) -> None:
+        handler = _handlers.get(record["kind"])
+        payload = record["payload"]
+        stage = f"outbox:{record['kind']}"
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"Нет обработчика для outbox kind={record['kind']}")
+            await handler(self._bot, payload)
+        except Exception as e:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+            STAGE_ERRORS.inc(stage=stage)
+            if isinstance(e, RetryLater) and e.payload is not None:
+                payload = e.payload
+            attempts = record["attempts"] + 1
+            delay = backoff_delay(attempts)
+            logger.warning(
+                "Доставка outbox #%s (%s) не удалась, попытка %s/%s, повтор через %.0f с: %s",
+                record['id'], record['kind'], attempts, OUTBOX_MAX_ATTEMPTS, delay, e
+            )
+            async with get_connection() as conn:
+                await conn.execute(
+                    """
+                    UPDATE outbox
+                    SET attempts = $2, payload = $3::jsonb, last_error = $4,
+                        next_attempt_at = NOW() + make_interval(secs => $5)
+                    WHERE id = $1
+                    """,
+                    record["id"], attempts, json.dumps(payload, ensure_ascii=False), str(e), delay
+                )
+            return
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+        async with get_connection() as conn:
+            await conn.execute(
+                "UPDATE outbox SET sent_at = NOW(), attempts = attempts + 1, last_error = NULL WHERE id = $1",
+                record["id"]
+            )
+
+
+# Общий диспетчер приложения (запускается в on_startup, останавливается в on_shutdown)
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional, Sequence, Set
+from date.config import TICKET_BATCH_SIZE, TICKET_BATCH_DELAY
+from utils import outbox
+from utils.attachments import attachment_store
+from utils.database import get_connection
+from utils.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Колонки support_requests, которые заполняются при создании заявки (порядок значений в row)
+TICKET_COLUMNS = ("user_id", "name", "user_username", "email", "message", "document_path",
+                  "photo_path", "document_id", "photo_id")
+
+
+class _Pending(NamedTuple):
+    row: tuple
+    payload: dict
+    kinds: Sequence[str]
+    attachments: Sequence[str]
+    future: asyncio.Future
+
+
+class TicketBatcher:
+    """
+    Пакетная запись заявок в support_requests.
+
+    Заявки копятся в памяти до max_rows штук или max_delay секунд и
+    записываются одной транзакцией: идентификаторы резервируются из
+    последовательности, строки загружаются через COPY, в той же транзакции
+    создаются записи outbox. Обработчик получает id заявки только после
+    коммита, поэтому подтвержденная пользователю заявка не теряется.
+    При ошибке пакета заявки записываются по одной, чтобы одна
+    некорректная строка не отклонила остальные.
+    """
+
+    def __init__(self, max_rows: int = TICKET_BATCH_SIZE, max_delay: float = TICKET_BATCH_DELAY):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, row: tuple, payload: dict, kinds: Sequence[str], attachments: Sequence[str] = ()) -> int:
+        # Ставит заявку в пакет и ждет ее записи; payload получит request_id перед записью в outbox,
+        # attachments - SHA-256 файлов хранилища, которые связываются с заявкой
+        if self._closed:
+            raise RuntimeError("Пакетная запись заявок остановлена")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Pending(row, payload, kinds, attachments, future))
+        if len(self._pending) >= self.max_rows:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_pending)
+        # Отмена обработчика не отменяет запись уже принятой заявки
+        return await asyncio.shield(future)
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[_Pending]) -> None:
+        try:
+            ids = await self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error("Ошибка сохранения заявки в БД: %s", e)
+                self._resolve(batch[0], error=e)
+                return
+            logger.error("Ошибка пакетной записи %s заявок, записываем по одной: %s", len(batch), e)
+            for item in batch:
+                try:
+                    self._resolve(item, (await self._write([item]))[0])
+                except Exception as item_error:
+                    logger.error("Ошибка сохранения заявки в БД: %s", item_error)
+                    self._resolve(item, error=item_error)
+        else:
+            for item, request_id in zip(batch, ids):
+                self._resolve(item, request_id)
+            logger.info("Записан пакет заявок: %s", len(batch))
+        outbox.outbox_dispatcher.wake()
+
+    @staticmethod
+    def _resolve(item: _Pending, request_id: Optional[int] = None, error: Optional[Exception] = None) -> None:
+        if item.future.done():
+            return
+        if error is not None:
+            item.future.set_exception(error)
+        else:
+            item.future.set_result(request_id)
+
+    @staticmethod
+    async def _write(batch: List[_Pending]) -> List[int]:
+        async with get_connection() as conn:
+            async with conn.transaction():
+                ids = [
+                    row[0] for row in await conn.fetch(
+                        "SELECT nextval(pg_get_serial_sequence('support_requests', 'id')) "
+                        "FROM generate_series(1, $1)",
+                        len(batch)
+                    )
+                ]
+                await conn.copy_records_to_table(
+                    "support_requests",
+                    records=[(request_id, *item.row) for request_id, item in zip(ids, batch)],
+                    columns=("id",) + TICKET_COLUMNS,
+                )
+                for request_id, item in zip(ids, batch):
+                    if item.attachments:
+                        await attachment_store.link(conn, request_id, item.attachments)
+                await outbox.enqueue_many(conn, [
+                    (kind, {**item.payload, "request_id": request_id})
+                    for request_id, item in zip(ids, batch)
+                    for kind in item.kinds
+                ])
+        return ids
+
+    async def stop(self) -> None:
+        # Записывает все накопленные заявки; вызывается при остановке до закрытия пула
+        self._closed = True
+        self._flush_pending()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+# Общий экземпляр для обработчиков заявок (используется при TICKET_BATCHING=true)
+ticket_batcher = TicketBatcher()
+QUEUE_DEPTH.set_function(lambda: ticket_batcher.pending, queue="tickets")
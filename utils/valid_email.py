@@ -50,5 +50,5 @@ def is_valid_email(email: str) -> Tuple[bool, str]:
     if domain_parts[-1].isdigit():
         return False, "Последняя часть домена не может состоять только из цифр"
 
-    logger.debug(f"Email {email} прошел валидацию")
+    logger.debug("Email %s прошел валидацию", email)
     return True, ""
\ No newline at end of file
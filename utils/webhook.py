@@ -0,0 +1,72 @@
+import hmac
+import logging
+from typing import Callable
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiogram.utils.executor import Executor
+from date.config import (
+    WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, HEALTH_PATH,
+    SHUTDOWN_DRAIN_TIMEOUT, METRICS_PATH,
+)
+from middlewares.inflight import inflight
+from utils.database import get_pool_stats
+from utils.metrics import metrics_handler
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def check_secret_token(request: web.Request) -> None:
+    # Принимает обновления только с секретным токеном, заданным в setWebhook
+    if WEBHOOK_SECRET:
+        token = request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token, WEBHOOK_SECRET):
+            logger.warning("Отклонен запрос к webhook с неверным секретом от %s", request.remote)
+            raise web.HTTPUnauthorized()
+
+
+class SecretWebhookRequestHandler(WebhookRequestHandler):
+    async def post(self):
+        check_secret_token(self.request)
+        return await super().post()
+
+
+async def health(request: web.Request) -> web.Response:
+    # Проверка работоспособности для reverse proxy; при остановке отдает 503
+    status = 503 if inflight.draining else 200
+    return web.json_response(
+        {
+            "status": "draining" if inflight.draining else "ok",
+            "in_flight_updates": inflight.count,
+            "db_pool": get_pool_stats(),
+        },
+        status=status,
+    )
+
+
+def create_web_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get(HEALTH_PATH, health)
+    app.router.add_get(METRICS_PATH, metrics_handler)
+    return app
+
+
+async def register_webhook(dp: Dispatcher) -> None:
+    # Регистрирует webhook в Telegram; ожидающие обновления не сбрасываются
+    url = f"{WEBHOOK_HOST.rstrip('/')}{WEBHOOK_PATH}"
+    await dp.bot.set_webhook(url, secret_token=WEBHOOK_SECRET or None, drop_pending_updates=False)
+    logger.info("Webhook установлен: %s", url)
+
+
+def start_webhook(dp: Dispatcher, on_startup: Callable, on_shutdown: Callable) -> None:
+    # Запускает бота в режиме webhook на встроенном aiohttp-сервере
+    if not WEBHOOK_HOST:
+        raise RuntimeError("Для режима webhook необходимо задать WEBHOOK_HOST")
+    executor = Executor(dp, skip_updates=False)
+    executor.on_startup(on_startup, polling=False)
+    executor.on_startup(register_webhook, polling=False)
+    executor.on_shutdown(on_shutdown, polling=False)
+    executor.set_webhook(WEBHOOK_PATH, request_handler=SecretWebhookRequestHandler, web_app=create_web_app())
+    executor.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT, shutdown_timeout=SHUTDOWN_DRAIN_TIMEOUT)
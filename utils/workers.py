@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from date.config import (
+    RUN_MODE, WEBHOOK_PATH, WEBAPP_HOST, WEBAPP_PORT, HEALTH_PATH, SHUTDOWN_DRAIN_TIMEOUT,
+    WORKER_QUEUE_SIZE, WORKER_CONCURRENCY,
+)
+from utils.webhook import check_secret_token, register_webhook
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[Dispatcher], Awaitable[None]]
+
+# Номер текущего процесса-обработчика (None - в основном процессе)
+current_worker: Optional[int] = None
+
+# Типы обновлений, в которых чат указан явно, и те, где есть только пользователь
+_CHAT_UPDATES = ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+                 "chat_member", "chat_join_request")
+_USER_UPDATES = ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query", "poll_answer")
+
+
+def update_chat_id(update: dict) -> Optional[int]:
+    # Извлекает chat_id из "сырого" обновления Telegram
+    for kind in _CHAT_UPDATES:
+        if kind in update:
+            return update[kind]["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        if callback.get("message"):
+            return callback["message"]["chat"]["id"]
+        return callback["from"]["id"]
+    for kind in _USER_UPDATES:
+        obj = update.get(kind)
+        if obj:
+            user = obj.get("from") or obj.get("user")
+            if user:
+                return user["id"]
+    return None
+
+
+def shard_for(update: dict, shards: int) -> int:
+    # Все обновления одного чата попадают в один процесс, поэтому его FSM не делится между процессами
+    chat_id = update_chat_id(update)
+    return (chat_id if chat_id is not None else update.get("update_id", 0)) % shards
+
+
+def worker_main(index: int, updates: multiprocessing.Queue, dispatcher_factory: Callable[[], Dispatcher],
+                on_startup: Callback, on_shutdown: Callback) -> None:
+    # Точка входа процесса-обработчика; остановка - по None в очереди от супервизора или по SIGTERM
+    global current_worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    current_worker = index
+    asyncio.run(_worker_loop(index, updates, dispatcher_factory(), on_startup, on_shutdown))
+
+
+async def _process_update(dp: Dispatcher, data: dict, semaphore: asyncio.Semaphore) -> None:
+    try:
+        await dp.process_update(types.Update(**data))
+    except Exception as e:
+        logger.exception("Ошибка обработки обновления %s: %s", data.get('update_id'), e)
+    finally:
+        semaphore.release()
+
+
+async def _worker_loop(index: int, updates: multiprocessing.Queue, dp: Dispatcher,
+                       on_startup: Callback, on_shutdown: Callback) -> None:
+    Dispatcher.set_current(dp)
+    Bot.set_current(dp.bot)
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+
+    def stop() -> None:
+        # SIGTERM от менеджера служб: завершаемся так же, как по None от супервизора;
+        # повторный SIGTERM (или kill) завершает процесс сразу
+        if stopping.is_set():
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        logger.info("Процесс-обработчик %s получил SIGTERM, останавливается", index)
+        stopping.set()
+        # Будим поток, ожидающий очередь; сам процесс это значение может уже не прочитать
+        updates.cancel_join_thread()
+        try:
+            updates.put_nowait(None)
+        except queue_module.Full:
+            pass
+
+    loop.add_signal_handler(signal.SIGTERM, stop)
+    await on_startup(dp)
+    logger.info("Процесс-обработчик %s запущен", index)
+
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"worker-{index}-queue")
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+    tasks = set()
+    try:
+        while not stopping.is_set():
+            data = await loop.run_in_executor(reader, updates.get)
+            if data is None:
+                break
+            await semaphore.acquire()
+            task = loop.create_task(_process_update(dp, data, semaphore))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.wait(tasks, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        await on_shutdown(dp)
+        session = await dp.bot.get_session()
+        await session.close()
+        reader.shutdown(wait=False)
+        logger.info("Процесс-обработчик %s остановлен", index)
+
+
+class Supervisor:
+    """
+    Режим нескольких процессов.
+
+    Супервизор принимает обновления из одного источника (long polling или
+    webhook) и раскладывает их по очередям процессов-обработчиков по хэшу
+    chat_id. Общее состояние (FSM, заявки, outbox) хранится в PostgreSQL.
+    """
+
+    def __init__(self, processes: int, dispatcher_factory: Callable[[], Dispatcher],
+                 on_worker_startup: Callback, on_worker_shutdown: Callback):
+        context = multiprocessing.get_context("spawn")
+        self.queues: List[multiprocessing.Queue] = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(processes)]
+        self.processes = [
+            context.Process(
+                target=worker_main,
+                args=(index, updates, dispatcher_factory, on_worker_startup, on_worker_shutdown),
+                name=f"bot-worker-{index}",
+            )
+            for index, updates in enumerate(self.queues)
+        ]
+        self._stop = asyncio.Event()
+
+    async def dispatch(self, update: dict) -> None:
+        updates = self.queues[shard_for(update, len(self.queues))]
+        try:
+            updates.put_nowait(update)
+        except queue_module.Full:
+            # Очередь процесса заполнена - ждем освобождения, не блокируя event loop
+            await asyncio.get_running_loop().run_in_executor(None, updates.put, update)
+
+    async def _poll(self, dp: Dispatcher) -> None:
+        await dp.skip_updates()
+        offset = None
+        while not self._stop.is_set():
+            try:
+                updates = await dp.bot.get_updates(offset=offset, timeout=20)
+            except Exception as e:
+                logger.error("Ошибка получения обновлений: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self.dispatch(update.to_python())
+                offset = update.update_id + 1
+
+    async def _webhook(self, request: web.Request) -> web.Response:
+        check_secret_token(request)
+        await self.dispatch(await request.json())
+        return web.Response(text="ok")
+
+    async def _health(self, request: web.Request) -> web.Response:
+        alive = [process.is_alive() for process in self.processes]
+        return web.json_response({"status": "ok" if all(alive) else "degraded", "workers": alive},
+                                 status=200 if all(alive) else 503)
+
+    async def _serve(self, dp: Dispatcher, on_startup: Callback, on_shutdown: Callback) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stop.set)
+        Bot.set_current(dp.bot)
+
+        await on_startup(dp)
+        for process in self.processes:
+            process.start()
+        logger.info("Запущено процессов-обработчиков: %s", len(self.processes))
+
+        runner = None
+        if RUN_MODE == "webhook":
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, self._webhook)
+            app.router.add_get(HEALTH_PATH, self._health)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+            await register_webhook(dp)
+            await self._stop.wait()
+        else:
+            poller = loop.create_task(self._poll(dp))
+            await self._stop.wait()
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+
+        logger.info("Остановка супервизора")
+        if runner is not None:
+            await runner.cleanup()
+        await self.stop_workers()
+        await on_shutdown(dp)
+        session = await dp.bot.get_session()
+        await session.close()
+
+    async def stop_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for updates in self.queues:
+            await loop.run_in_executor(None, updates.put, None)
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, SHUTDOWN_DRAIN_TIMEOUT + 10)
+            if process.is_alive():
+                logger.warning("Процесс %s не завершился вовремя, останавливаем принудительно", process.name)
+                # SIGTERM обработчик воспринимает как обычную остановку, поэтому - SIGKILL
+                process.kill()
+
+    def run(self, dp: Dispatcher, on_startup: Callback, on_shutdown: Callback) -> None:
+        asyncio.run(self._serve(dp, on_startup, on_shutdown))